@@ -0,0 +1,90 @@
+"""Throughput of adding recipes one by one against the bulk endpoints.
+
+For each batch size, adds that many recipes to the favorites and to the
+shopping cart with one request per recipe, then with a single request
+to ``/api/recipes/{favorite,shopping_cart}/bulk/``, emptying them in
+between, and reports the median of a few rounds. The shopping cart
+side includes the upkeep of the ingredient totals.
+
+    python benchmarks/bulk_cart.py [--sizes 7 50]
+"""
+import argparse
+import statistics
+import time
+
+import common
+
+from recipes import models
+
+KINDS = ('favorite', 'shopping_cart')
+
+
+def create_recipes(author, number, ingredients=5):
+    recipes = models.Recipe.objects.bulk_create(
+        models.Recipe(author=author, name=f'recipe {index}', text='text',
+                      cooking_time=10)
+        for index in range(number)
+    )
+    units = models.MeasurementUnit.objects.bulk_create(
+        [models.MeasurementUnit(name='g')]
+    )
+    catalogue = models.Ingredient.objects.bulk_create(
+        models.Ingredient(name=f'ingredient {index}',
+                          measurement_unit=units[0])
+        for index in range(ingredients)
+    )
+    models.RecipeIngredient.objects.bulk_create(
+        models.RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                amount=index + 1)
+        for recipe in recipes
+        for index, ingredient in enumerate(catalogue)
+    )
+    return [recipe.pk for recipe in recipes]
+
+
+def timed(add, empty, rounds=5):
+    """Median time of ``add()``, emptying the list after each round."""
+    timings = []
+    for _ in range(rounds + 1):
+        started = time.perf_counter()
+        add()
+        timings.append(time.perf_counter() - started)
+        empty()
+    return statistics.median(timings[1:])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[7, 50])
+    args = parser.parse_args()
+    with common.test_database():
+        author, user = common.create_users('user', 2)
+        ids = create_recipes(author, max(args.sizes))
+        client = common.api_client(user)
+        print(f'{"kind":>14} {"recipes":>8} {"per item":>10} {"bulk":>10}')
+        for size in args.sizes:
+            for kind in KINDS:
+                chosen = ids[:size]
+                bulk_url = f'/api/recipes/{kind}/bulk/'
+
+                def per_item():
+                    for pk in chosen:
+                        response = client.post(f'/api/recipes/{pk}/{kind}/')
+                        assert response.status_code == 201, response.data
+
+                def bulk():
+                    response = client.post(bulk_url, {'ids': chosen},
+                                           format='json')
+                    assert response.status_code == 200, response.data
+
+                def empty():
+                    client.delete(bulk_url, {'ids': chosen}, format='json')
+
+                timings = [timed(add, empty) for add in (per_item, bulk)]
+                print(f'{kind:>14} {size:>8} '
+                      + ' '.join(f'{timing * 1000:>7.1f} ms'
+                                 for timing in timings))
+
+
+if __name__ == '__main__':
+    main()
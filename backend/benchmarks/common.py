@@ -0,0 +1,71 @@
+"""Set-up shared by the benchmarks.
+
+Importing this module configures Django with the project settings, so
+run the scripts from ``backend/`` with the same environment as the
+server, e.g. ``python benchmarks/shopping_list.py``. Every benchmark
+works in a throwaway test database created next to the configured one
+and dropped at the end; point DB_ENGINE at PostgreSQL to get numbers
+that mean something.
+"""
+import os
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import django
+from django.test.runner import DiscoverRunner
+from django.test.utils import (setup_test_environment,
+                               teardown_test_environment)
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'foodgram'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+django.setup()
+
+
+@contextmanager
+def test_database():
+    """Run the block against a fresh, migrated test database."""
+    setup_test_environment()
+    runner = DiscoverRunner(verbosity=0, interactive=False)
+    old_config = runner.setup_databases()
+    try:
+        yield
+    finally:
+        runner.teardown_databases(old_config)
+        teardown_test_environment()
+
+
+def measure(function, repeat=20, warmup=2):
+    """Median wall time of ``function()`` in seconds."""
+    for _ in range(warmup):
+        function()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def api_client(user):
+    """API client authenticated with the user's token."""
+    from rest_framework.authtoken.models import Token
+    from rest_framework.test import APIClient
+
+    client = APIClient()
+    token, _ = Token.objects.get_or_create(user=user)
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client
+
+
+def create_users(prefix, number):
+    """``number`` users named ``prefix0``, ``prefix1``..."""
+    from django.contrib.auth import get_user_model
+
+    User = get_user_model()
+    return User.objects.bulk_create(
+        User(username=f'{prefix}{index}', email=f'{prefix}{index}@example.com')
+        for index in range(number)
+    )
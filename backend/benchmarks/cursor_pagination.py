@@ -0,0 +1,80 @@
+"""Latency of deep recipe list pages, offset against cursor pagination.
+
+Creates the recipes in batches and requests the page at growing
+depths, once as ``?page=N`` and once as ``?pagination=cursor`` with the
+cursor a client would hold after scrolling that far. Offset pages get
+slower with the depth, the database walks every row it skips, while
+the cursor pages stay a range scan of the ``(pub_date, id)`` index. The
+total count is cached after the first offset page, so it is not part of
+the timings.
+
+    python benchmarks/cursor_pagination.py [--recipes 1000000]
+"""
+import argparse
+
+import common
+from rest_framework import pagination
+
+from api.paginators import RecipeCursorPagination
+from recipes import models
+
+BATCH = 10000
+DEPTHS = (1, 10, 100, 1000, 10000, 50000)
+
+
+def create_recipes(author, number):
+    for start in range(0, number, BATCH):
+        models.Recipe.objects.bulk_create(
+            models.Recipe(author=author, name=f'recipe {index}',
+                          text='text', cooking_time=10)
+            for index in range(start, min(start + BATCH, number))
+        )
+
+
+def cursor_url(depth, limit):
+    """Link to the page ``depth`` as the previous page would give it."""
+    paginator = RecipeCursorPagination()
+    paginator.base_url = (
+        f'http://testserver/api/recipes/?pagination=cursor&limit={limit}'
+    )
+    if depth == 1:
+        return paginator.base_url
+    date, pk = models.Recipe.objects.order_by(
+        '-pub_date', '-id'
+    ).values_list('pub_date', 'id')[(depth - 1) * limit - 1]
+    return paginator.encode_cursor(pagination.Cursor(
+        offset=0,
+        reverse=False,
+        position=f'{date.isoformat()}|{pk}'
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--recipes', type=int, default=1000000)
+    parser.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+    with common.test_database():
+        author, reader = common.create_users('user', 2)
+        create_recipes(author, args.recipes)
+        client = common.api_client(reader)
+        print(f'{"page":>8} {"offset":>10} {"cursor":>10}')
+        for depth in DEPTHS:
+            if (depth - 1) * args.limit >= args.recipes:
+                break
+            urls = (
+                f'/api/recipes/?page={depth}&limit={args.limit}',
+                cursor_url(depth, args.limit),
+            )
+            for url in urls:
+                assert client.get(url).status_code == 200, url
+            timings = [
+                common.measure(lambda: client.get(url), repeat=10) * 1000
+                for url in urls
+            ]
+            print(f'{depth:>8} '
+                  + ' '.join(f'{timing:>7.1f} ms' for timing in timings))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Throughput of the recipe read serializers.
+
+Loads pages of recipes with ``recipe_queryset``, each recipe with ten
+ingredients and three tags, and renders the loaded pages over and over
+with ``RecipeSerializer`` and ``JSONRenderer``, as before, and with
+``RecipeFastSerializer`` and ``ORJSONRenderer``. The queries are not
+part of the timings, only the serialization and the rendering.
+
+    python benchmarks/fast_serializer.py [--sizes 10 50 100]
+"""
+import argparse
+
+import common
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.renderers import ORJSONRenderer
+from api.serializers import RecipeFastSerializer, RecipeSerializer
+from api.views import recipe_queryset
+from recipes import models
+
+PATHS = (
+    ('old', RecipeSerializer, JSONRenderer),
+    ('fast', RecipeFastSerializer, ORJSONRenderer),
+)
+
+
+def create_recipes(authors, number, ingredients=10):
+    unit = models.MeasurementUnit.objects.create(name='g')
+    catalogue = models.Ingredient.objects.bulk_create(
+        models.Ingredient(name=f'ingredient {index}', measurement_unit=unit)
+        for index in range(ingredients)
+    )
+    tags = models.Tag.objects.bulk_create(
+        models.Tag(name=f'tag {index}', color=f'#00000{index}',
+                   slug=f'tag{index}')
+        for index in range(3)
+    )
+    recipes = models.Recipe.objects.bulk_create(
+        models.Recipe(author=authors[index % len(authors)],
+                      name=f'recipe {index}', text='text ' * 50,
+                      cooking_time=10)
+        for index in range(number)
+    )
+    models.RecipeIngredient.objects.bulk_create(
+        models.RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                amount=index + 1)
+        for recipe in recipes
+        for index, ingredient in enumerate(catalogue)
+    )
+    models.RecipeTag.objects.bulk_create(
+        models.RecipeTag(recipe=recipe, tag=tag)
+        for recipe in recipes
+        for tag in tags
+    )
+
+
+def render(serializer_class, renderer_class, recipes, request):
+    data = serializer_class(
+        recipes,
+        many=True,
+        context={'request': request}
+    ).data
+    return renderer_class().render(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10, 50, 100])
+    args = parser.parse_args()
+    with common.test_database():
+        user, *authors = common.create_users('user', 6)
+        create_recipes(authors, max(args.sizes))
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = user
+        print(f'{"recipes":>8} {"old":>14} {"fast":>14} {"speedup":>8}')
+        for size in args.sizes:
+            recipes = list(recipe_queryset(user)[:size])
+            rates = []
+            for _, serializer_class, renderer_class in PATHS:
+                timing = common.measure(lambda: render(
+                    serializer_class, renderer_class, recipes, request
+                ))
+                rates.append(size / timing)
+            print(f'{size:>8} '
+                  + ' '.join(f'{rate:>8.0f} rec/s' for rate in rates)
+                  + f' {rates[1] / rates[0]:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
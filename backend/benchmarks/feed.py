@@ -0,0 +1,74 @@
+"""Latency of the subscription feed, merged on read against the inbox.
+
+Creates authors with twenty recipes each and, for every number of
+follows, a reader following that many random authors. The first feed
+page is then timed in both RECIPE_FEED_MODE settings: ``read`` merges
+the followed authors' recipes at request time, ``write`` pages the
+reader's inbox. The backfill column is what filling that inbox took
+when the follows were made.
+
+    python benchmarks/feed.py [--authors 3000] [--follows 10 100 1000 3000]
+"""
+import argparse
+import random
+import time
+
+import common
+from django.test import override_settings
+
+from recipes import models
+
+RECIPES_PER_AUTHOR = 20
+
+
+def create_recipes(authors):
+    """Recipes of all authors interleaved, as they would be published."""
+    for _ in range(RECIPES_PER_AUTHOR):
+        models.Recipe.objects.bulk_create(
+            (
+                models.Recipe(author=author, name='recipe', text='text',
+                              cooking_time=10)
+                for author in authors
+            ),
+            batch_size=5000
+        )
+
+
+def follow(reader, authors):
+    models.Following.objects.bulk_create(
+        models.Following(user=reader, author=author) for author in authors
+    )
+    started = time.perf_counter()
+    with override_settings(RECIPE_FEED_MODE='write'):
+        for author in authors:
+            models.FeedEntry.objects.follow(reader, author)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--authors', type=int, default=3000)
+    parser.add_argument('--follows', type=int, nargs='+',
+                        default=[10, 100, 1000, 3000])
+    parser.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+    with common.test_database():
+        authors = common.create_users('author', args.authors)
+        create_recipes(authors)
+        print(f'{"follows":>8} {"read":>10} {"write":>10} {"backfill":>10}')
+        for follows in args.follows:
+            reader, = common.create_users(f'reader{follows}-', 1)
+            backfill = follow(reader, random.sample(authors, follows))
+            client = common.api_client(reader)
+            url = f'/api/recipes/feed/?limit={args.limit}'
+            timings = []
+            for mode in ('read', 'write'):
+                with override_settings(RECIPE_FEED_MODE=mode):
+                    timings.append(common.measure(lambda: client.get(url)))
+            print(f'{follows:>8} '
+                  + ' '.join(f'{timing * 1000:>7.1f} ms' for timing in timings)
+                  + f' {backfill:>8.2f} s')
+
+
+if __name__ == '__main__':
+    main()
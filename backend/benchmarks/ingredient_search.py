@@ -0,0 +1,70 @@
+"""Latency of the ingredient autocomplete.
+
+Loads the ingredient catalogue and looks up typical prefixes three
+ways: the unranked, unlimited ``icontains`` filter the endpoint used
+before, the database filter with prefix ranking and the result cap,
+and the in-memory index (INGREDIENT_SEARCH_IN_MEMORY). Each lookup is
+serialized as the endpoint does; the response cache is left out.
+
+    python benchmarks/ingredient_search.py [--queries с мо молоко]
+"""
+import argparse
+import io
+
+import common
+from django.conf import settings
+from django.core.management import call_command
+
+from api.filters import IngredientFilter
+from api.search import ingredient_index
+from api.serializers import IngredientListSerializer
+from recipes import models
+
+QUERIES = ('с', 'мо', 'сах', 'молоко', 'соль', 'ма')
+
+
+def serialize(ingredients):
+    return IngredientListSerializer(ingredients, many=True).data
+
+
+def catalogue():
+    return models.Ingredient.objects.select_related('measurement_unit')
+
+
+def before(value):
+    return serialize(catalogue().filter(name__icontains=value))
+
+
+def database(value):
+    queryset = IngredientFilter().filter_name(catalogue(), 'name', value)
+    return serialize(queryset[:settings.INGREDIENT_SEARCH_LIMIT])
+
+
+def memory(value):
+    return serialize(
+        ingredient_index.search(value, settings.INGREDIENT_SEARCH_LIMIT)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--queries', nargs='+', default=QUERIES)
+    args = parser.parse_args()
+    with common.test_database():
+        call_command('loadingr', stdout=io.StringIO())
+        print(f'catalogue of {models.Ingredient.objects.count()} '
+              f'ingredients, limit {settings.INGREDIENT_SEARCH_LIMIT}')
+        print(f'{"query":>8} {"matches":>8} {"before":>10} '
+              f'{"database":>10} {"memory":>10}')
+        for value in args.queries:
+            matches = len(before(value))
+            timings = [
+                common.measure(lambda: search(value)) * 1000
+                for search in (before, database, memory)
+            ]
+            print(f'{value:>8} {matches:>8} '
+                  + ' '.join(f'{timing:>7.2f} ms' for timing in timings))
+
+
+if __name__ == '__main__':
+    main()
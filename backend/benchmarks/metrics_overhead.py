@@ -0,0 +1,96 @@
+"""Cost of the Prometheus metrics on every request.
+
+Times a cheap and a typical request with and without MetricsMiddleware,
+alternating the two over several rounds and keeping the best mean of
+each, then the query timer it installs on a bare ``SELECT 1``.
+
+    python benchmarks/metrics_overhead.py [--requests 200]
+"""
+import argparse
+import time
+
+import common
+from django.db import connection
+from django.test import modify_settings
+
+from api.middleware import QueryTimer
+from recipes import models
+
+URLS = ('/api/tags/', '/api/recipes/?limit=10')
+ROUNDS = 7
+
+
+def create_recipes(author, number=30):
+    tags = models.Tag.objects.bulk_create(
+        models.Tag(name=f'tag {index}', color=f'#00000{index}',
+                   slug=f'tag{index}')
+        for index in range(3)
+    )
+    for index in range(number):
+        recipe = models.Recipe.objects.create(
+            author=author, name=f'recipe {index}', text='text',
+            cooking_time=10
+        )
+        recipe.tags.set(tags)
+
+
+def mean_time(function, number):
+    started = time.perf_counter()
+    for _ in range(number):
+        function()
+    return (time.perf_counter() - started) / number
+
+
+def request_overhead(user, url, number):
+    """Best mean time of the request with and without the metrics.
+
+    A client loads the middleware on its first request and keeps it, so
+    the client without the metrics makes that request with it removed.
+    """
+    with_metrics = common.api_client(user)
+    without_metrics = common.api_client(user)
+    with modify_settings(
+        MIDDLEWARE={'remove': 'api.middleware.MetricsMiddleware'}
+    ):
+        without_metrics.get(url)
+    timings = {with_metrics: [], without_metrics: []}
+    for _ in range(ROUNDS):
+        for client, rounds in timings.items():
+            rounds.append(mean_time(lambda: client.get(url), number))
+    return min(timings[with_metrics]), min(timings[without_metrics])
+
+
+def query_overhead(number=3000):
+    def select():
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+
+    without = min(mean_time(select, number) for _ in range(ROUNDS))
+    with connection.execute_wrapper(QueryTimer()):
+        timed = min(mean_time(select, number) for _ in range(ROUNDS))
+    return timed, without
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+    with common.test_database():
+        author, = common.create_users('author', 1)
+        create_recipes(author)
+        print(f'{"":>24} {"with":>9} {"without":>9} {"overhead":>9}')
+        rows = [
+            (url, *request_overhead(author, url, args.requests))
+            for url in URLS
+        ]
+        rows.append(('SELECT 1', *query_overhead()))
+        for name, with_metrics, without_metrics in rows:
+            overhead = with_metrics - without_metrics
+            print(f'{name:>24} {with_metrics * 1e6:>6.0f} us '
+                  f'{without_metrics * 1e6:>6.0f} us '
+                  f'{overhead * 1e6:>6.1f} us '
+                  f'({overhead / without_metrics:.1%})')
+
+
+if __name__ == '__main__':
+    main()
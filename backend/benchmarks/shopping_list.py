@@ -0,0 +1,91 @@
+"""Latency and memory of the shopping list download.
+
+Fills carts of 10, 100 and 1000 recipes, each recipe using ten of the
+catalogue's ingredients, and downloads them in every format. The peak
+is the Python memory allocated while the whole body is read, as
+measured by tracemalloc; it should stay flat as the carts grow.
+
+    python benchmarks/shopping_list.py [--sizes 10 100 1000]
+"""
+import argparse
+import io
+import random
+import tracemalloc
+
+import common
+from django.core.management import call_command
+
+from recipes import models
+
+FORMATS = ('txt', 'csv', 'json')
+
+
+def create_cart(user, author, ingredients, size):
+    recipes = models.Recipe.objects.bulk_create(
+        models.Recipe(author=author, name=f'recipe {index}', text='text',
+                      cooking_time=10)
+        for index in range(size)
+    )
+    models.RecipeIngredient.objects.bulk_create(
+        (
+            models.RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                    amount=random.randint(1, 500))
+            for recipe in recipes
+            for ingredient in random.sample(ingredients, 10)
+        ),
+        batch_size=5000
+    )
+    models.ShopRecipe.objects.bulk_create(
+        models.ShopRecipe(user=user, recipe=recipe) for recipe in recipes
+    )
+    models.ShopIngredient.objects.add_recipes(
+        user,
+        [recipe.pk for recipe in recipes]
+    )
+
+
+def download(client, file_format):
+    response = client.get(
+        f'/api/recipes/download_shopping_cart/?format={file_format}'
+    )
+    return sum(len(chunk) for chunk in response.streaming_content)
+
+
+def peak_memory(function):
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10, 100, 1000])
+    args = parser.parse_args()
+    with common.test_database():
+        call_command('loadingr', stdout=io.StringIO())
+        ingredients = list(models.Ingredient.objects.all())
+        author, = common.create_users('author', 1)
+        print(f'{"recipes":>8} {"format":>6} {"lines":>6} {"bytes":>8} '
+              f'{"latency":>10} {"peak":>9}')
+        for size in args.sizes:
+            user, = common.create_users(f'cart{size}-', 1)
+            create_cart(user, author, ingredients, size)
+            client = common.api_client(user)
+            lines = models.ShopIngredient.objects.filter(user=user).count()
+            for file_format in FORMATS:
+                length = download(client, file_format)
+                latency = common.measure(
+                    lambda: download(client, file_format),
+                    repeat=10
+                )
+                peak = peak_memory(lambda: download(client, file_format))
+                print(f'{size:>8} {file_format:>6} {lines:>6} {length:>8} '
+                      f'{latency * 1000:>7.1f} ms {peak / 1024:>6.0f} KiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+import copy
+
+from rest_framework.authentication import TokenAuthentication
+
+from api.cache import cache_stats, is_shared, token_cache
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication that remembers recently seen tokens.
+
+    Saves the token and user query on every authenticated request. The
+    cache is dropped when a token is deleted or a user is edited, and
+    entries expire after TOKEN_CACHE_TIMEOUT seconds in any case.
+
+    The drop goes through the version kept in Django's cache, so tokens
+    are only cached when that cache is shared by the workers, as with
+    REDIS_URL. With the default in-memory cache a token revoked by one
+    worker would keep working on the others, and every request is
+    checked against the database as with TokenAuthentication.
+    """
+
+    cache_namespace = 'tokens'
+
+    def authenticate_credentials(self, key):
+        if not is_shared():
+            return super().authenticate_credentials(key)
+        entry = token_cache.get(self.cache_namespace, key)
+        cache_stats.record(self.cache_namespace, hit=entry is not None)
+        if entry is None:
+            entry = super().authenticate_credentials(key)
+            token_cache.set(self.cache_namespace, key, entry)
+        user, token = entry
+        return copy.copy(user), token
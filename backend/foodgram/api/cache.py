@@ -0,0 +1,200 @@
+import hashlib
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from api.metrics import cache_requests_total
+
+
+def request_key(request):
+    """Absolute path and query string with the parameters and their
+    values in a stable order."""
+    return (
+        request.build_absolute_uri(request.path),
+        tuple(
+            (name, tuple(sorted(values)))
+            for name, values in sorted(request.query_params.lists())
+        )
+    )
+
+
+def initial_version():
+    """Version for a namespace whose key is missing or was evicted.
+
+    Based on the clock rather than 1, so entries stored under an evicted
+    version can never become current again.
+    """
+    return time.time_ns()
+
+
+def is_shared(alias='default'):
+    """Whether every process sees the same cache, so a version bumped
+    by one worker is seen by the others."""
+    return not isinstance(caches[alias], (LocMemCache, DummyCache))
+
+
+def get_version(namespace):
+    """Current version of a group of cached data."""
+    key = f'version:{namespace}'
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, initial_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace):
+    """Make everything cached under the previous version stale."""
+    key = f'version:{namespace}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, initial_version(), timeout=None)
+
+
+class LocalCache:
+    """Process-local LRU with an optional time to live.
+
+    Entries are stored under the version of their namespace, so bumping
+    the version is all it takes to invalidate them.
+    """
+
+    def __init__(self, max_entries, timeout=None):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.max_entries = max_entries
+        self.timeout = timeout
+
+    def get(self, namespace, key):
+        entry_key = (namespace, get_version(namespace), key)
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires < time.monotonic():
+                del self._entries[entry_key]
+                return None
+            self._entries.move_to_end(entry_key)
+            return value
+
+    def set(self, namespace, key, value):
+        entry_key = (namespace, get_version(namespace), key)
+        expires = None
+        if self.timeout is not None:
+            expires = time.monotonic() + self.timeout
+        with self._lock:
+            self._entries[entry_key] = (expires, value)
+            self._entries.move_to_end(entry_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+
+class PayloadCache(LocalCache):
+    """Process-local LRU of pre-rendered response bodies."""
+
+    def set(self, namespace, key, content):
+        """Store ``content`` and return the ``(etag, content)`` entry."""
+        return super().set(
+            namespace,
+            key,
+            (f'"{hashlib.md5(content).hexdigest()}"', content)
+        )
+
+
+class SharedPayloadCache:
+    """Pre-rendered response bodies in Django's cache.
+
+    Unlike ``PayloadCache`` the entries are shared by every process
+    using the same cache backend, and expire after ``timeout`` seconds.
+    """
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+
+    def _key(self, namespace, key):
+        digest = hashlib.md5(repr(key).encode()).hexdigest()
+        return f'payload:{namespace}:{get_version(namespace)}:{digest}'
+
+    def get(self, namespace, key):
+        return cache.get(self._key(namespace, key))
+
+    def set(self, namespace, key, content):
+        """Store ``content`` and return the ``(etag, content)`` entry."""
+        entry = (f'"{hashlib.md5(content).hexdigest()}"', content)
+        cache.set(self._key(namespace, key), entry, self.timeout)
+        return entry
+
+
+class CacheStats:
+    """Process-local hit and miss counters of the caches.
+
+    Every lookup is also counted in ``foodgram_cache_requests_total``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+    def record(self, namespace, hit):
+        result = 'hit' if hit else 'miss'
+        cache_requests_total.labels(namespace, result).inc()
+        with self._lock:
+            self._counts[namespace, result] += 1
+
+    def snapshot(self):
+        """``{(namespace, 'hit' or 'miss'): count}`` so far."""
+        with self._lock:
+            return dict(self._counts)
+
+
+class VersionedValue:
+    """Process-local value recomputed when its namespace version changes.
+
+    Also recomputed after ``timeout`` seconds, for the changes whose
+    version bump this process does not see, and on ``get(reload=True)``.
+    """
+
+    def __init__(self, namespace, loader, timeout=None):
+        self._lock = threading.Lock()
+        self._namespace = namespace
+        self._loader = loader
+        self.timeout = timeout
+        self._version = None
+        self._expires = None
+        self._value = None
+
+    def _expired(self):
+        return self._expires is not None and self._expires < time.monotonic()
+
+    def get(self, reload=False):
+        version = get_version(self._namespace)
+        with self._lock:
+            if reload or self._version != version or self._expired():
+                self._value = self._loader()
+                self._version = version
+                if self.timeout is not None:
+                    self._expires = time.monotonic() + self.timeout
+            return self._value
+
+
+catalogue_cache = PayloadCache(
+    settings.CATALOGUE_CACHE_MAX_ENTRIES,
+    settings.CATALOGUE_CACHE_TIMEOUT
+)
+response_cache = SharedPayloadCache(settings.RESPONSE_CACHE_TIMEOUT)
+cache_stats = CacheStats()
+token_cache = LocalCache(
+    settings.TOKEN_CACHE_MAX_ENTRIES,
+    settings.TOKEN_CACHE_TIMEOUT
+)
+following_cache = LocalCache(
+    settings.FOLLOWING_CACHE_MAX_ENTRIES,
+    settings.FOLLOWING_CACHE_TIMEOUT
+)
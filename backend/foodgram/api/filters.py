@@ -1,30 +1,76 @@
+from django import forms
+from django.conf import settings
+from django.db.models import (Case, Exists, IntegerField, OuterRef, Value,
+                              When)
 from django_filters import rest_framework as filters
 
+from api.cache import VersionedValue
 from recipes import models
 
+tag_ids = VersionedValue(
+    'catalogue',
+    lambda: dict(models.Tag.objects.values_list('slug', 'id')),
+    settings.CATALOGUE_CACHE_TIMEOUT
+)
+
 
 class RecipeFilter(filters.FilterSet):
     """Recipe filter."""
 
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=models.Tag.objects.all()
+    tags = filters.Filter(
+        method='filter_tags',
+        widget=forms.MultipleHiddenInput
     )
     author = filters.NumberFilter(field_name='author__id')
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.ChoiceFilter(
+        choices=(('popular', 'popular'), ),
+        method='filter_ordering'
+    )
 
     class Meta:
         model = models.Recipe
-        fields = ('tags', 'author',)
+        fields = ('tags', 'author', 'search', 'ordering',)
+
+    def filter_search(self, queryset, name, value):
+        return queryset.search(value)
+
+    def filter_ordering(self, queryset, name, value):
+        """Most favorited first, along the recipe_popular index."""
+        return queryset.order_by('-favorites_count', '-pub_date', '-id')
+
+    def filter_tags(self, queryset, name, value):
+        """Recipes with any of the tags, without joining or DISTINCT.
+
+        An unknown slug reloads the slugs, it may be a tag created in
+        another worker.
+        """
+        slugs = tag_ids.get()
+        if not slugs.keys() >= set(value):
+            slugs = tag_ids.get(reload=True)
+        return queryset.filter(Exists(models.RecipeTag.objects.filter(
+            recipe=OuterRef('pk'),
+            tag_id__in=[slugs[slug] for slug in value if slug in slugs]
+        )))
 
 
 class IngredientFilter(filters.FilterSet):
     """Ingredient filter."""
 
-    name = filters.CharFilter(
-        field_name='name', lookup_expr='icontains'
-    )
+    name = filters.CharFilter(method='filter_name')
 
     class Meta:
         model = models.Ingredient
         fields = ('name', )
+
+    def filter_name(self, queryset, name, value):
+        """Substring search with prefix matches ranked first."""
+        return queryset.filter(
+            name__icontains=value
+        ).annotate(
+            is_prefix=Case(
+                When(name__istartswith=value, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField()
+            )
+        ).order_by('is_prefix', 'name')
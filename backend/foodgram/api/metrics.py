@@ -0,0 +1,79 @@
+import os
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1, 2.5, 5, 10
+)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+requests_total = Counter(
+    'foodgram_requests_total',
+    'Requests by view, method and status code.',
+    ('view', 'method', 'status')
+)
+request_duration = Histogram(
+    'foodgram_request_duration_seconds',
+    'Time spent on a request, up to the response headers.',
+    ('view', 'method'),
+    buckets=LATENCY_BUCKETS
+)
+db_queries = Histogram(
+    'foodgram_request_db_queries',
+    'Database queries run by a request.',
+    ('view', 'method'),
+    buckets=QUERY_BUCKETS
+)
+db_duration = Histogram(
+    'foodgram_request_db_duration_seconds',
+    'Time a request spent waiting on the database.',
+    ('view', 'method'),
+    buckets=LATENCY_BUCKETS
+)
+response_size = Histogram(
+    'foodgram_response_size_bytes',
+    'Size of the response body, streamed responses excluded.',
+    ('view', 'method'),
+    buckets=SIZE_BUCKETS
+)
+cache_requests_total = Counter(
+    'foodgram_cache_requests_total',
+    'Cache lookups by namespace and result.',
+    ('namespace', 'result')
+)
+
+
+def registry():
+    """Registry with the metrics of every worker process.
+
+    Gunicorn workers write their samples to PROMETHEUS_MULTIPROC_DIR,
+    see gunicorn.conf.py; without it only this process is reported.
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    collector_registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(collector_registry)
+    return collector_registry
+
+
+def metrics(request):
+    """Metrics in the Prometheus text format.
+
+    Requires ``Authorization: Bearer <METRICS_TOKEN>`` when the token
+    is set.
+    """
+    if settings.METRICS_TOKEN and not constant_time_compare(
+        request.headers.get('Authorization', ''),
+        f'Bearer {settings.METRICS_TOKEN}'
+    ):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        generate_latest(registry()),
+        content_type=CONTENT_TYPE_LATEST
+    )
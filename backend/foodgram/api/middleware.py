@@ -0,0 +1,219 @@
+import logging
+import os
+import re
+import time
+import traceback
+from collections import Counter
+
+import django
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from api import metrics
+
+logger = logging.getLogger(__name__)
+
+DJANGO_DIR = os.path.dirname(django.__file__) + os.sep
+
+SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+SQL_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+
+
+def fingerprint(sql):
+    """SQL with its parameters, literals and IN lists replaced by ``?``,
+    so the same statement run with other values looks the same."""
+    sql = SQL_LITERALS.sub('?', sql.replace('%s', '?'))
+    return SQL_LISTS.sub('(?)', sql)
+
+
+def call_site():
+    """``path:line in function`` of the project code closest to the
+    query, followed by the closest library code outside Django when
+    that is what ran the query, e.g. a DRF field."""
+    base = str(settings.BASE_DIR) + os.sep
+    library = None
+    for frame in reversed(traceback.extract_stack()[:-2]):
+        filename = frame.filename
+        if filename == __file__ or filename.startswith(DJANGO_DIR):
+            continue
+        if 'site-packages' in filename or not filename.startswith(base):
+            if library is None:
+                library = (
+                    f'{filename.rpartition("site-packages" + os.sep)[2]}'
+                    f':{frame.lineno} in {frame.name}'
+                )
+            continue
+        site = f'{filename[len(base):]}:{frame.lineno} in {frame.name}'
+        return f'{site} via {library}' if library else site
+    return library or 'unknown'
+
+
+def watch_stream(content, wrapper, done):
+    """Stream ``content`` with ``wrapper`` seeing the queries run to
+    make each chunk, then call ``done``.
+
+    Streamed responses run their queries after the middleware returns,
+    while the server sends the body.
+    """
+    iterator = iter(content)
+    while True:
+        with connection.execute_wrapper(wrapper):
+            chunk = next(iterator, None)
+        if chunk is None:
+            break
+        yield chunk
+    done()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A request ran more queries than its view allows, or repeated the
+    same statement too many times."""
+
+
+class QueryTimer:
+    """``execute_wrapper`` counting the queries and the time they take."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+class MetricsMiddleware:
+    """Record latency, database use and response size of every request.
+
+    Requests are labelled with the name of the URL pattern they matched,
+    such as ``api:recipes-list``, so all the routes of the API are
+    covered without listing them. Keep it first in MIDDLEWARE to time
+    the other middleware too. The database use of streamed responses
+    includes the queries run while streaming and is recorded once the
+    body is sent.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        started = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+        match = request.resolver_match
+        view = match.view_name if match else '<unmatched>'
+        method = request.method
+        metrics.requests_total.labels(
+            view,
+            method,
+            response.status_code
+        ).inc()
+        metrics.request_duration.labels(view, method).observe(duration)
+
+        def record_database_use():
+            metrics.db_queries.labels(view, method).observe(timer.count)
+            metrics.db_duration.labels(view, method).observe(timer.duration)
+
+        if response.streaming:
+            response.streaming_content = watch_stream(
+                response.streaming_content,
+                timer,
+                record_database_use
+            )
+        else:
+            record_database_use()
+            metrics.response_size.labels(view, method).observe(
+                len(response.content)
+            )
+        return response
+
+
+class QueryRecorder:
+    """``execute_wrapper`` grouping the queries by fingerprint."""
+
+    def __init__(self):
+        self.count = 0
+        self.fingerprints = Counter()
+        self.call_sites = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        key = fingerprint(sql)
+        self.fingerprints[key] += 1
+        if key not in self.call_sites:
+            self.call_sites[key] = call_site()
+        return execute(sql, params, many, context)
+
+
+class QueryBudgetMiddleware:
+    """Check the queries of every request against its view's budget.
+
+    Viewsets declare ``query_budgets``, the most queries each action
+    may run on any database, counted as in the tests, where each atomic
+    block opens a savepoint and releases it. A statement repeated
+    QUERY_REPEAT_THRESHOLD times or more with different parameters is
+    reported too, as the mark of an N+1. QUERY_BUDGET_MODE is ``off``
+    (the middleware is dropped), ``warn`` (logged) or ``raise``
+    (QueryBudgetExceeded, which fails the test making the request).
+    Streamed responses are checked once their body has been read, with
+    the queries run while streaming included.
+    """
+
+    def __init__(self, get_response):
+        if settings.QUERY_BUDGET_MODE == 'off':
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        if response.streaming:
+            response.streaming_content = watch_stream(
+                response.streaming_content,
+                recorder,
+                lambda: self.report(request, recorder)
+            )
+        else:
+            self.report(request, recorder)
+        return response
+
+    def report(self, request, recorder):
+        problems = self.check(request, recorder)
+        if problems:
+            match = request.resolver_match
+            view = match.view_name if match else request.path
+            message = f'{request.method} {view}: ' + '\n'.join(problems)
+            if settings.QUERY_BUDGET_MODE == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        actions = getattr(view_func, 'actions', None)
+        if actions:
+            budgets = getattr(view_func.cls, 'query_budgets', {})
+            request._query_budget = budgets.get(
+                actions.get(request.method.lower())
+            )
+
+    def check(self, request, recorder):
+        problems = []
+        budget = getattr(request, '_query_budget', None)
+        if budget is not None and recorder.count > budget:
+            problems.append(
+                f'{recorder.count} queries, the budget is {budget}.'
+            )
+        for key, count in recorder.fingerprints.most_common():
+            if count < settings.QUERY_REPEAT_THRESHOLD:
+                break
+            problems.append(
+                f'{count} times from {recorder.call_sites[key]}: {key}'
+            )
+        return problems
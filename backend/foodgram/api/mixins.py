@@ -1,5 +1,10 @@
+from django.http import HttpResponse, HttpResponseNotModified
 from rest_framework import mixins, viewsets
 
+from api.cache import (cache_stats, catalogue_cache, request_key,
+                       response_cache)
+from api.renderers import ORJSONRenderer
+
 
 class RetrieveListViewSet(mixins.ListModelMixin,
                           mixins.RetrieveModelMixin,
@@ -7,3 +12,77 @@ class RetrieveListViewSet(mixins.ListModelMixin,
     """Viewset to retrieve either a list or a single item."""
 
     pass
+
+
+class PayloadCacheMixin:
+    """Serve list and retrieve as cached JSON bytes with an ETag.
+
+    The payload is rendered once per namespace version and query, and a
+    matching If-None-Match header is answered with 304 Not Modified.
+    """
+
+    cache_namespace = None
+    payload_cache = None
+
+    def list(self, request, *args, **kwargs):
+        return self._cached(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached(super().retrieve, request, *args, **kwargs)
+
+    def use_payload_cache(self, request):
+        return request.accepted_renderer.format == 'json'
+
+    def _cached(self, view, request, *args, **kwargs):
+        if not self.use_payload_cache(request):
+            return view(request, *args, **kwargs)
+        key = request_key(request)
+        entry = self.payload_cache.get(self.cache_namespace, key)
+        cache_stats.record(self.cache_namespace, hit=entry is not None)
+        if entry is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            entry = self.payload_cache.set(
+                self.cache_namespace,
+                key,
+                ORJSONRenderer().render(response.data)
+            )
+        etag, content = entry
+        if etag in request.headers.get('If-None-Match', ''):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(
+                content,
+                content_type='application/json'
+            )
+        response['ETag'] = etag
+        return response
+
+
+class CatalogueCacheMixin(PayloadCacheMixin):
+    """Catalogue payloads cached in process until the catalogue changes.
+
+    The change is seen through the version in Django's cache, which the
+    other workers only share with REDIS_URL; with the default in-memory
+    cache they pick it up once CATALOGUE_CACHE_TIMEOUT has passed.
+    """
+
+    cache_namespace = 'catalogue'
+    payload_cache = catalogue_cache
+
+
+class AnonymousCacheMixin(PayloadCacheMixin):
+    """Payloads for anonymous users shared through Django's cache.
+
+    Anonymous responses carry no per-user state (is_favorited and the
+    like are always false), so one body serves every anonymous client.
+    """
+
+    payload_cache = response_cache
+
+    def use_payload_cache(self, request):
+        return (
+            not request.user.is_authenticated
+            and super().use_payload_cache(request)
+        )
@@ -1,7 +1,210 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+
+from api.cache import get_version
+
+
+class CountingPage(Page):
+    """Page that knows whether another one follows without the count."""
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+
+class CountingPaginator(Paginator):
+    """Paginator with a configurable way of counting the objects.
+
+    ``exact`` runs COUNT(*) every time. ``cached`` keeps the count of
+    each query for PAGINATION_COUNT_CACHE_TIMEOUT seconds. ``estimate``
+    caches as well, but on a miss takes the PostgreSQL planner's row
+    estimate and only counts exactly below
+    PAGINATION_COUNT_ESTIMATE_THRESHOLD rows. Cached counts are kept
+    under the version of ``namespace`` when one is given.
+
+    A cached or estimated count is only shown, never used to slice:
+    pages fetch one row more than they show to tell if another follows.
+    """
+
+    def __init__(self, object_list, per_page, count_strategy='exact',
+                 namespace=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_strategy = count_strategy
+        self.namespace = namespace
+
+    @cached_property
+    def count(self):
+        if self.count_strategy == 'exact':
+            return super().count
+        try:
+            sql, params = self.object_list.query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+        key = 'count:' + hashlib.md5(
+            repr((sql, params)).encode()
+        ).hexdigest()
+        if self.namespace is not None:
+            key += f':{self.namespace}:{get_version(self.namespace)}'
+        count = cache.get(key)
+        if count is None:
+            if self.count_strategy == 'estimate':
+                count = self._estimate()
+            if count is None:
+                count = super().count
+            cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+        return count
+
+    def page(self, number):
+        if self.count_strategy == 'exact':
+            return super().page(number)
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage('That page contains no results')
+        has_next = len(rows) > self.per_page
+        seen = bottom + min(len(rows), self.per_page)
+        if not has_next:
+            self.count = seen
+        elif self.count <= seen:
+            self.count = seen + 1
+        return CountingPage(rows[:self.per_page], number, self, has_next)
+
+    def _estimate(self):
+        queryset = self.object_list
+        if connections[queryset.db].vendor != 'postgresql':
+            return None
+        plan = json.loads(queryset.order_by().explain(format='json'))
+        rows = plan[0]['Plan']['Plan Rows']
+        if rows < settings.PAGINATION_COUNT_ESTIMATE_THRESHOLD:
+            return None
+        return rows
 
 
 class PageLimitPagination(pagination.PageNumberPagination):
-    """Custom paginator to set the limit."""
+    """Custom paginator to set the limit.
+
+    Views choose how the total is counted with ``count_strategy``.
+    """
 
     page_size_query_param = 'limit'
+    count_strategy = 'exact'
+    count_namespace = None
+
+    def django_paginator_class(self, object_list, per_page):
+        return CountingPaginator(
+            object_list,
+            per_page,
+            count_strategy=self.count_strategy,
+            namespace=self.count_namespace
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count_strategy = getattr(
+            view,
+            'count_strategy',
+            self.count_strategy
+        )
+        self.count_namespace = getattr(view, 'cache_namespace', None)
+        return super().paginate_queryset(queryset, request, view)
+
+
+class RecipeCursorPagination(pagination.CursorPagination):
+    """Keyset pagination over the recipe feed.
+
+    The cursor holds the ``(pub_date, id)`` of the last recipe shown, so
+    every page is a range scan of the matching index however deep the
+    client has scrolled, and no COUNT(*) is run. Subclasses can page
+    other models by a different date and id pair through ``ordering``.
+    """
+
+    ordering = ('-pub_date', '-id')
+    page_size_query_param = 'limit'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = self._decode_position(self.cursor)
+        date_field, id_field = (field.lstrip('-') for field in self.ordering)
+
+        if position is not None:
+            date, pk = position
+            after = 'gt' if reverse else 'lt'
+            queryset = queryset.filter(**{
+                f'{date_field}__{"gte" if reverse else "lte"}': date
+            }).filter(
+                Q(**{f'{date_field}__{after}': date})
+                | Q(**{date_field: date, f'{id_field}__{after}': pk})
+            )
+        ordering = (date_field, id_field) if reverse else self.ordering
+        results = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        return self.page
+
+    def _decode_position(self, cursor):
+        if cursor is None or cursor.position is None:
+            return None
+        try:
+            date, pk = cursor.position.split('|')
+            date = parse_datetime(date)
+            if date is None:
+                raise ValueError
+            return date, int(pk)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def _link(self, item, reverse):
+        date_field, id_field = (field.lstrip('-') for field in self.ordering)
+        date, pk = getattr(item, date_field), getattr(item, id_field)
+        return self.encode_cursor(pagination.Cursor(
+            offset=0,
+            reverse=reverse,
+            position=f'{date.isoformat()}|{pk}'
+        ))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self._link(self.page[0], reverse=True)
+
+
+class FeedCursorPagination(RecipeCursorPagination):
+    """Keyset pagination over a user's feed inbox."""
+
+    ordering = ('-pub_date', '-recipe_id')
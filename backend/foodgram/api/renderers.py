@@ -0,0 +1,107 @@
+import csv
+import json
+
+import orjson
+from rest_framework import renderers
+
+
+class Echo:
+    """File-like object that returns what is written to it."""
+
+    def write(self, value):
+        return value
+
+
+class ORJSONRenderer(renderers.JSONRenderer):
+    """JSONRenderer encoding with orjson.
+
+    Compact UTF-8 output is byte for byte what JSONRenderer gives;
+    indented, spaced or ASCII-only output is left to JSONRenderer. Types
+    orjson does not know, and dates and times, go through the DRF
+    encoder as before.
+    """
+
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        if not self.compact or self.ensure_ascii or self.get_indent(
+            accepted_media_type,
+            renderer_context
+        ):
+            return super().render(
+                data,
+                accepted_media_type,
+                renderer_context
+            )
+        content = orjson.dumps(
+            data,
+            default=self.encoder_class().default,
+            option=self.options
+        )
+        # Escaped by JSONRenderer for JavaScript, see its render().
+        return content.replace(
+            '\u2028'.encode(), b'\\u2028'
+        ).replace(
+            '\u2029'.encode(), b'\\u2029'
+        )
+
+
+class ShoppingCartRenderer(renderers.BaseRenderer):
+    """Base renderer for the shopping list.
+
+    ``stream`` turns ``(name, measurement_unit, amount)`` rows into
+    chunks as they arrive, so the list never sits in memory as a whole.
+    """
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return renderers.JSONRenderer().render(data)
+
+    def stream(self, rows):
+        raise NotImplementedError
+
+
+class ShoppingCartTextRenderer(ShoppingCartRenderer):
+    """Shopping list as plain text."""
+
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, rows):
+        for name, measurement_unit, amount in rows:
+            yield f'-{name}({measurement_unit})-{amount}\n'
+
+
+class ShoppingCartCSVRenderer(ShoppingCartRenderer):
+    """Shopping list as CSV."""
+
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(('name', 'measurement_unit', 'amount'))
+        for row in rows:
+            yield writer.writerow(row)
+
+
+class ShoppingCartJSONRenderer(ShoppingCartRenderer):
+    """Shopping list as a JSON array."""
+
+    media_type = 'application/json'
+    format = 'json'
+
+    def stream(self, rows):
+        separator = '['
+        for name, measurement_unit, amount in rows:
+            yield separator + json.dumps({
+                'name': name,
+                'measurement_unit': measurement_unit,
+                'amount': amount
+            }, ensure_ascii=False)
+            separator = ','
+        yield ']' if separator == ',' else '[]'
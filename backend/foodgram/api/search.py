@@ -0,0 +1,70 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from api.cache import get_version
+from recipes import models
+
+
+class IngredientIndex:
+    """Ingredient catalogue kept in memory as an array sorted by name.
+
+    Prefix matches are found with a binary search and come first,
+    substring matches fill the rest of the result. The index is built
+    lazily and rebuilt once the catalogue version changes, or after
+    ``timeout`` seconds for the changes made by other processes when
+    the version is not shared with them.
+    """
+
+    def __init__(self, timeout=None):
+        self._lock = threading.Lock()
+        self.timeout = timeout
+        self._version = None
+        self._expires = None
+        self._keys = None
+        self._ingredients = None
+
+    def _expired(self):
+        return self._expires is not None and self._expires < time.monotonic()
+
+    def _load(self):
+        version = get_version('catalogue')
+        with self._lock:
+            if self._version != version or self._expired():
+                ingredients = sorted(
+                    models.Ingredient.objects.select_related(
+                        'measurement_unit'
+                    ),
+                    key=lambda ingredient: (ingredient.name.lower(),
+                                            ingredient.id)
+                )
+                self._ingredients = ingredients
+                self._keys = [
+                    ingredient.name.lower() for ingredient in ingredients
+                ]
+                self._version = version
+                if self.timeout is not None:
+                    self._expires = time.monotonic() + self.timeout
+            return self._keys, self._ingredients
+
+    def search(self, value, limit):
+        keys, ingredients = self._load()
+        value = value.lower()
+        start = bisect_left(keys, value)
+        end = start
+        while end < len(keys) and keys[end].startswith(value):
+            end += 1
+        result = ingredients[start:min(end, start + limit)]
+        if len(result) < limit:
+            for position, key in enumerate(keys):
+                if start <= position < end or value not in key:
+                    continue
+                result.append(ingredients[position])
+                if len(result) == limit:
+                    break
+        return result
+
+
+ingredient_index = IngredientIndex(settings.CATALOGUE_CACHE_TIMEOUT)
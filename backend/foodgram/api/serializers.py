@@ -1,32 +1,162 @@
 import base64
+import binascii
+import tempfile
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
-from django.core.files.base import ContentFile
-from django.shortcuts import get_object_or_404
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.base import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.http import Http404
 from rest_framework import serializers
 
+from api.cache import cache_stats, following_cache, is_shared
 from recipes import models
+from recipes.images import schedule_thumbnails
 
 User = get_user_model()
 
 
 class Base64ImageField(serializers.ImageField):
-    """Serializer for decoding images."""
+    """Serializer for decoding images.
+
+    The size is checked before decoding, and the payload is decoded
+    chunk by chunk into a temporary file that only spills to disk past
+    FILE_UPLOAD_MAX_MEMORY_SIZE.
+    """
+
+    default_error_messages = {
+        'max_size': 'The image cannot be larger than {max_size} bytes.'
+    }
+    chunk_size = 1 << 16
 
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            if len(imgstr) // 4 * 3 > settings.RECIPE_IMAGE_MAX_SIZE:
+                self.fail('max_size', max_size=settings.RECIPE_IMAGE_MAX_SIZE)
+            file = tempfile.SpooledTemporaryFile(
+                max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+            )
+            try:
+                for start in range(0, len(imgstr), self.chunk_size):
+                    file.write(base64.b64decode(
+                        imgstr[start:start + self.chunk_size],
+                        validate=True
+                    ))
+            except binascii.Error:
+                self.fail('invalid_image')
+            file.seek(0)
+            data = File(file, name='temp.' + ext)
+        elif getattr(data, 'size', 0) > settings.RECIPE_IMAGE_MAX_SIZE:
+            self.fail('max_size', max_size=settings.RECIPE_IMAGE_MAX_SIZE)
 
         return super().to_internal_value(data)
 
 
+class ThumbnailsField(serializers.ReadOnlyField):
+    """URLs of the image thumbnails by format and width."""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', 'image_thumbnails')
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return thumbnail_urls(value, self.context.get('request'))
+
+
+class PrimaryKeysField(serializers.ManyRelatedField):
+    """Many primary keys looked up with one query instead of one each."""
+
+    def __init__(self, queryset, **kwargs):
+        super().__init__(
+            child_relation=serializers.PrimaryKeyRelatedField(
+                queryset=queryset
+            ),
+            **kwargs
+        )
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        child = self.child_relation
+        queryset = child.get_queryset()
+        pks = []
+        for value in data:
+            if isinstance(value, bool):
+                child.fail('incorrect_type', data_type=type(value).__name__)
+            try:
+                pks.append(queryset.model._meta.pk.to_python(value))
+            except DjangoValidationError:
+                child.fail('incorrect_type', data_type=type(value).__name__)
+        objects = queryset.in_bulk(pks)
+        for value, pk in zip(data, pks):
+            if pk not in objects:
+                child.fail('does_not_exist', pk_value=value)
+        return [objects[pk] for pk in pks]
+
+
+def thumbnail_urls(thumbnails, request):
+    """``{format: {width: URL}}`` of the stored thumbnail names."""
+    urls = {}
+    for image_format, sizes in thumbnails.items():
+        urls[image_format] = {}
+        for width, name in sizes.items():
+            url = default_storage.url(name)
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls[image_format][width] = url
+    return urls
+
+
+def followed_author_ids(request):
+    """Ids of the authors the user follows.
+
+    Loaded once per request and shared by every serializer rendering
+    users. When Django's cache is shared by the workers, so that all of
+    them see the version bumped on follow and unfollow, the ids are also
+    kept for FOLLOWING_CACHE_TIMEOUT seconds between requests.
+    """
+    user = request.user
+    if isinstance(user, AnonymousUser):
+        return frozenset()
+    ids = getattr(request, '_followed_author_ids', None)
+    if ids is None:
+        ids = (
+            cached_author_ids(user) if is_shared() else load_author_ids(user)
+        )
+        request._followed_author_ids = ids
+    return ids
+
+
+def load_author_ids(user):
+    return frozenset(
+        models.Following.objects.filter(
+            user=user
+        ).values_list('author_id', flat=True)
+    )
+
+
+def cached_author_ids(user):
+    namespace = f'following:{user.pk}'
+    ids = following_cache.get(namespace, user.pk)
+    cache_stats.record('following', hit=ids is not None)
+    if ids is None:
+        ids = following_cache.set(namespace, user.pk, load_author_ids(user))
+    return ids
+
+
 class UserSerializer(serializers.ModelSerializer):
     """Users serializer."""
 
     is_subscribed = serializers.SerializerMethodField()
+    followers_count = serializers.SerializerMethodField()
+    following_count = serializers.SerializerMethodField()
 
     class Meta:
         fields = (
@@ -35,19 +165,22 @@ class UserSerializer(serializers.ModelSerializer):
             'username',
             'first_name',
             'last_name',
-            'is_subscribed'
+            'is_subscribed',
+            'followers_count',
+            'following_count'
         )
         model = User
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        if isinstance(user, AnonymousUser):
-            return False
-        following = models.Following.objects.filter(
-            user=user,
-            author=obj
-        ).exists()
-        return following
+        return obj.pk in followed_author_ids(self.context['request'])
+
+    def get_followers_count(self, obj):
+        stats = getattr(obj, 'follow_stats', None)
+        return stats.followers_count if stats else 0
+
+    def get_following_count(self, obj):
+        stats = getattr(obj, 'follow_stats', None)
+        return stats.following_count if stats else 0
 
 
 class UserCreateSerializer(serializers.ModelSerializer):
@@ -83,7 +216,7 @@ class IngredientSerializer(serializers.ModelSerializer):
 
     class Meta:
         fields = ('id', 'name', 'measurement_unit', 'amount')
-        model = models.Amount
+        model = models.RecipeIngredient
 
     def validate_amount(self, value):
         if value < 0:
@@ -118,16 +251,23 @@ class RecipeSerializer(serializers.ModelSerializer):
     """Recipe serializer."""
 
     author = UserSerializer(read_only=True)
-    ingredients = IngredientSerializer(many=True, read_only=True)
+    ingredients = IngredientSerializer(
+        many=True,
+        read_only=True,
+        source='recipe_ingredients'
+    )
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    thumbnails = ThumbnailsField()
 
     class Meta:
-        fields = '__all__'
+        exclude = ('search_vector', 'image_thumbnails', )
         model = models.Recipe
         depth = 1
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         if isinstance(self.context['request'].user, AnonymousUser):
             return False
         return (
@@ -138,6 +278,8 @@ class RecipeSerializer(serializers.ModelSerializer):
         )
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         if isinstance(self.context['request'].user, AnonymousUser):
             return False
         return (
@@ -148,28 +290,125 @@ class RecipeSerializer(serializers.ModelSerializer):
         )
 
 
+class RecipeFastSerializer:
+    """Read-only ``RecipeSerializer`` built with plain dicts.
+
+    Gives the same JSON as ``RecipeSerializer`` for recipes loaded with
+    ``recipe_queryset``, without the per-field machinery of DRF that
+    dominates the CPU time of recipe pages. Authors and tags shared by
+    several recipes of a page are built once.
+    """
+
+    date_field = serializers.DateTimeField()
+
+    def __init__(self, instance=None, many=False, context=None, **kwargs):
+        self.instance = instance
+        self.many = many
+        self.context = context or {}
+
+    @property
+    def data(self):
+        request = self.context.get('request')
+        followed = followed_author_ids(request)
+        authors, tags = {}, {}
+        if self.many:
+            return [
+                self._recipe(recipe, request, followed, authors, tags)
+                for recipe in self.instance
+            ]
+        return self._recipe(self.instance, request, followed, authors, tags)
+
+    def _recipe(self, recipe, request, followed, authors, tags):
+        author = authors.get(recipe.author_id)
+        if author is None:
+            author = authors[recipe.author_id] = self._author(
+                recipe.author,
+                followed
+            )
+        image = None
+        if recipe.image:
+            image = recipe.image.url
+            if request is not None:
+                image = request.build_absolute_uri(image)
+        recipe_tags = []
+        for tag in recipe.tags.all():
+            data = tags.get(tag.pk)
+            if data is None:
+                data = tags[tag.pk] = {
+                    'id': tag.pk,
+                    'name': tag.name,
+                    'color': tag.color,
+                    'slug': tag.slug
+                }
+            recipe_tags.append(data)
+        return {
+            'id': recipe.pk,
+            'author': author,
+            'ingredients': [
+                self._ingredient(item)
+                for item in recipe.recipe_ingredients.all()
+            ],
+            'is_favorited': recipe.is_favorited,
+            'is_in_shopping_cart': recipe.is_in_shopping_cart,
+            'thumbnails': thumbnail_urls(recipe.image_thumbnails, request),
+            'name': recipe.name,
+            'image': image,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+            'pub_date': self.date_field.to_representation(recipe.pub_date),
+            'favorites_count': recipe.favorites_count,
+            'tags': recipe_tags
+        }
+
+    def _ingredient(self, item):
+        unit = item.ingredient.measurement_unit
+        return {
+            'id': item.ingredient.pk,
+            'name': item.ingredient.name,
+            'measurement_unit': str(unit) if unit is not None else None,
+            'amount': item.amount
+        }
+
+    def _author(self, author, followed):
+        stats = getattr(author, 'follow_stats', None)
+        return {
+            'email': author.email,
+            'id': author.pk,
+            'username': author.username,
+            'first_name': author.first_name,
+            'last_name': author.last_name,
+            'is_subscribed': author.pk in followed,
+            'followers_count': stats.followers_count if stats else 0,
+            'following_count': stats.following_count if stats else 0
+        }
+
+
 class RecipeWriteSerializer(serializers.ModelSerializer):
     """Serializer for recipe entry."""
 
     author = UserSerializer(
         read_only=True
     )
-    ingredients = IngredientSerializer(many=True, required=False)
-    tags = serializers.PrimaryKeyRelatedField(
+    ingredients = IngredientSerializer(
         many=True,
+        required=False,
+        source='recipe_ingredients'
+    )
+    tags = PrimaryKeysField(
         required=False,
         queryset=models.Tag.objects.all()
     )
     image = Base64ImageField(required=False, allow_null=True)
+    thumbnails = ThumbnailsField()
 
     class Meta:
-        fields = '__all__'
+        exclude = ('search_vector', 'image_thumbnails', )
         model = models.Recipe
 
     def validate_author(self, value):
         if value != self.context['request'].user:
             raise serializers.ValidationError(
-                'Unable to edit other users' recipes!'
+                "Unable to edit other users' recipes!"
             )
         return value
 
@@ -192,94 +431,72 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
 
     def _add_related(self, ingredients, tags, recipe):
         if ingredients:
-            recipe.ingredients.clear()
-            for ingredient in ingredients:
-                current_ingredient = get_object_or_404(
-                    models.Ingredient,
-                    id=ingredient['ingredient']['id']
-                )
-                current_amount = models.Amount.objects.get_or_create(
-                    ingredient=current_ingredient,
+            ingredient_ids = [
+                ingredient['ingredient']['id'] for ingredient in ingredients
+            ]
+            if len(models.Ingredient.objects.in_bulk(
+                ingredient_ids
+            )) != len(ingredient_ids):
+                raise Http404('No Ingredient matches the given query.')
+            models.RecipeIngredient.objects.filter(recipe=recipe).delete()
+            models.RecipeIngredient.objects.bulk_create(
+                models.RecipeIngredient(
+                    recipe=recipe,
+                    ingredient_id=ingredient['ingredient']['id'],
                     amount=ingredient['amount']
                 )
-                recipe.ingredients.add(current_amount[0].id)
+                for ingredient in ingredients
+            )
         if tags:
             recipe.tags.clear()
-            for tag in tags:
-                current_tag = get_object_or_404(models.Tag, id=tag.id)
-                models.RecipeTag.objects.create(
-                    tag=current_tag,
-                    recipe=recipe
-                )
+            models.RecipeTag.objects.bulk_create(
+                models.RecipeTag(recipe=recipe, tag=tag) for tag in tags
+            )
 
+    @transaction.atomic
     def create(self, validated_data):
-        ingredients = validated_data.pop('ingredients')
+        ingredients = validated_data.pop('recipe_ingredients')
         tags = validated_data.pop('tags')
         recipe = models.Recipe.objects.create(**validated_data)
         self._add_related(ingredients, tags, recipe)
+        models.Recipe.objects.filter(pk=recipe.pk).update_search_vector()
+        models.FeedEntry.objects.fan_out(recipe)
+        if recipe.image:
+            schedule_thumbnails(recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop('ingredients')
+        ingredients = validated_data.pop('recipe_ingredients')
         tags = validated_data.pop('tags')
+        previous = models.ShopIngredient.objects.contribution(instance)
         self._add_related(ingredients, tags, instance)
-        return super().update(instance, validated_data)
-
-
-class ShoppingCartSerializer(serializers.ModelSerializer):
-    """"Cart serializer."""
-
-    class Meta:
-        fields = '__all__'
-        model = models.ShopRecipe
-        validators = [
-            serializers.UniqueTogetherValidator(
-                queryset=models.ShopRecipe.objects.all(),
-                fields=['user', 'recipe']
-            )
-        ]
-
-
-class FavoritedSerializer(serializers.ModelSerializer):
-    """"Favorite serializer."""
-
-    class Meta:
-        fields = '__all__'
-        model = models.FavoriteRecipe
-        validators = [
-            serializers.UniqueTogetherValidator(
-                queryset=models.FavoriteRecipe.objects.all(),
-                fields=['user', 'recipe']
-            )
-        ]
-
+        if ingredients:
+            models.ShopIngredient.objects.replace_recipe(instance, previous)
+        instance = super().update(instance, validated_data)
+        models.Recipe.objects.filter(pk=instance.pk).update_search_vector()
+        if 'image' in validated_data:
+            schedule_thumbnails(instance)
+        return instance
 
-class FollowingSerializer(serializers.ModelSerializer):
-    """"Following users serializer."""
 
-    class Meta:
-        fields = '__all__'
-        model = models.Following
-        validators = [
-            serializers.UniqueTogetherValidator(
-                queryset=models.Following.objects.all(),
-                fields=['user', 'author']
-            )
-        ]
+class RecipeIdsSerializer(serializers.Serializer):
+    """Recipe ids for the bulk cart and favorite endpoints."""
 
-    def validate_author(self, value):
-        if value == self.initial_data['user']:
-            raise serializers.ValidationError(
-                'You can't subscribe to yourself!'
-            )
-        return value
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_MAX_ITEMS
+    )
 
 
 class RecipeSubSerializer(serializers.ModelSerializer):
     """Serializer for recipe preview."""
 
+    thumbnails = ThumbnailsField()
+
     class Meta:
-        fields = ('id', 'name', 'image', 'cooking_time', )
+        fields = ('id', 'name', 'image', 'thumbnails', 'cooking_time', )
         model = models.Recipe
 
 
@@ -304,14 +521,13 @@ class UserSubsrcibeSerializer(serializers.ModelSerializer):
         model = User
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        following = models.Following.objects.filter(
-            user=obj,
-            author=user
-        ).exists()
-        return following
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return obj.pk in followed_author_ids(self.context['request'])
 
     def get_recipes(self, obj):
+        if hasattr(obj, 'recipes_preview'):
+            return RecipeSubSerializer(obj.recipes_preview, many=True).data
         limit = self.context['request'].query_params.get('recipes_limit')
         if limit:
             return RecipeSubSerializer(
@@ -324,6 +540,8 @@ class UserSubsrcibeSerializer(serializers.ModelSerializer):
         ).data
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return models.Recipe.objects.filter(author=obj).count()
 
 
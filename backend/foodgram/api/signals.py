@@ -0,0 +1,124 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import (m2m_changed, post_delete, post_init,
+                                      post_save, pre_delete)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.cache import bump_version
+from recipes import models
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=models.Tag)
+@receiver(post_delete, sender=models.Tag)
+@receiver(post_save, sender=models.Ingredient)
+@receiver(post_delete, sender=models.Ingredient)
+@receiver(post_save, sender=models.MeasurementUnit)
+@receiver(post_delete, sender=models.MeasurementUnit)
+def bump_catalogue_version(**kwargs):
+    transaction.on_commit(lambda: bump_version('catalogue'))
+    bump_recipes_version()
+
+
+@receiver(post_save, sender=models.Recipe)
+@receiver(post_delete, sender=models.Recipe)
+@receiver(post_save, sender=models.RecipeTag)
+@receiver(post_delete, sender=models.RecipeTag)
+@receiver(post_save, sender=models.RecipeIngredient)
+@receiver(post_delete, sender=models.RecipeIngredient)
+@receiver(m2m_changed, sender=models.Recipe.tags.through)
+def bump_recipes_version(**kwargs):
+    """Drop the cached recipe payloads once the change is committed, so
+    no request can cache the old data under the new version."""
+    transaction.on_commit(lambda: bump_version('recipes'))
+
+
+def credentials(user):
+    """Fields that decide whether the user's tokens are still valid.
+
+    Read from ``__dict__`` so that deferred fields are not loaded.
+    """
+    return user.__dict__.get('password'), user.__dict__.get('is_active')
+
+
+@receiver(post_init, sender=User)
+def remember_credentials(instance, **kwargs):
+    instance._credentials = credentials(instance)
+
+
+@receiver(post_save, sender=User)
+def bump_user_versions(instance, created=False, update_fields=None,
+                       **kwargs):
+    """Forget the cached tokens when the password or the active flag
+    changes, and the recipe payloads when the profile does.
+
+    A new user has neither tokens nor recipes yet.
+    """
+    previous = getattr(instance, '_credentials', None)
+    instance._credentials = credentials(instance)
+    if created:
+        return
+    if instance._credentials != previous:
+        bump_tokens_version()
+    if update_fields and set(update_fields) <= {'last_login', 'password'}:
+        return
+    bump_recipes_version()
+
+
+@receiver(post_delete, sender=Token)
+def bump_tokens_version(**kwargs):
+    """Forget the cached tokens on logout, deactivation and password
+    changes."""
+    transaction.on_commit(lambda: bump_version('tokens'))
+
+
+@receiver(post_save, sender=models.Ingredient)
+def update_recipe_search_vectors(instance, raw=False, created=False,
+                                 **kwargs):
+    """Reindex only the recipes that use a renamed ingredient."""
+    if not raw and not created:
+        models.Recipe.objects.filter(
+            ingredients=instance
+        ).update_search_vector()
+
+
+@receiver(post_save, sender=models.Following)
+@receiver(post_delete, sender=models.Following)
+def bump_following_version(instance, **kwargs):
+    """Forget the cached set of authors the follower follows."""
+    transaction.on_commit(
+        lambda: bump_version(f'following:{instance.user_id}')
+    )
+
+
+@receiver(pre_delete, sender=models.Recipe)
+def remove_deleted_recipes_from_carts(instance, origin=None, **kwargs):
+    """Take deleted recipes out of the shopping list totals.
+
+    Runs before the cascade removes their ShopRecipe rows. Every recipe
+    a deletion reaches is handled with the first one, so deleting an
+    author or a selection of recipes takes the same queries as one.
+    """
+    if getattr(origin, '_carts_updated', False):
+        return
+    if isinstance(origin, User):
+        recipes = models.Recipe.objects.filter(author=origin)
+    elif isinstance(origin, QuerySet) and origin.model is User:
+        recipes = models.Recipe.objects.filter(author__in=origin)
+    elif isinstance(origin, QuerySet) and origin.model is models.Recipe:
+        recipes = origin
+    else:
+        recipes = [instance.pk]
+    models.ShopIngredient.objects.remove_recipes(recipes)
+    if origin is not None and origin is not instance:
+        origin._carts_updated = True
+
+
+@receiver(pre_delete, sender=User)
+def forget_deleted_user_follows(instance, **kwargs):
+    """Update the follow counters of the other side of the Following
+    rows the deletion cascades to."""
+    models.FollowStats.objects.forget(instance)
@@ -0,0 +1,852 @@
+import json
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import connection
+from django.http import QueryDict
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from api import (filters, metrics, middleware, renderers, search,
+                 serializers)
+from api.cache import get_version
+from api.views import RecipeViewSet, recipe_queryset
+from recipes import models
+
+User = get_user_model()
+
+
+class APITestCase(TestCase):
+    """A small catalogue, two users and helpers to make recipes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        unit = models.MeasurementUnit.objects.create(name='g')
+        cls.ingredients = [
+            models.Ingredient.objects.create(
+                name=f'ingredient {number}',
+                measurement_unit=unit
+            )
+            for number in range(6)
+        ]
+        cls.tags = [
+            models.Tag.objects.create(name=f'tag {number}', slug=f't{number}')
+            for number in range(3)
+        ]
+        cls.user = User.objects.create_user(
+            username='user',
+            email='user@example.com',
+            password='password'
+        )
+        cls.author = User.objects.create_user(
+            username='author',
+            email='author@example.com',
+            password='password'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = self.client_for(self.user)
+
+    def client_for(self, user):
+        client = APIClient()
+        token, _ = Token.objects.get_or_create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+    def create_recipe(self, author=None, amounts=(10, 20, 30), name='soup'):
+        recipe = models.Recipe.objects.create(
+            author=author or self.author,
+            name=name,
+            text='text',
+            cooking_time=5
+        )
+        models.RecipeIngredient.objects.bulk_create(
+            models.RecipeIngredient(
+                recipe=recipe,
+                ingredient=ingredient,
+                amount=amount
+            )
+            for ingredient, amount in zip(self.ingredients, amounts)
+        )
+        recipe.tags.set(self.tags[:2])
+        return recipe
+
+
+class ShoppingListTotalsTests(APITestCase):
+    """The stored totals always match the carts, whatever changes them."""
+
+    def assertTotalsUpToDate(self):
+        stored = set(models.ShopIngredient.objects.values_list(
+            'user_id',
+            'ingredient_id',
+            'amount',
+            'recipes_count'
+        ))
+        expected = {
+            (row['user_id'], row['ingredient_id'], row['total'], row['count'])
+            for row in models.ShopIngredient.objects.calculate()
+        }
+        self.assertEqual(stored, expected)
+
+    def add_to_cart(self, *recipes):
+        for recipe in recipes:
+            response = self.client.post(
+                f'/api/recipes/{recipe.pk}/shopping_cart/'
+            )
+            self.assertEqual(response.status_code, 201)
+
+    def test_api_changes(self):
+        first, second = self.create_recipe(), self.create_recipe()
+        self.add_to_cart(first, second)
+        self.assertTotalsUpToDate()
+        response = self.client_for(self.author).patch(
+            f'/api/recipes/{first.pk}/',
+            {
+                'ingredients': [
+                    {'id': self.ingredients[0].pk, 'amount': 1},
+                    {'id': self.ingredients[5].pk, 'amount': 2},
+                ],
+                'tags': [self.tags[0].pk],
+                'name': 'soup',
+                'text': 'text',
+                'cooking_time': 5
+            },
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTotalsUpToDate()
+        self.client_for(self.author).delete(f'/api/recipes/{second.pk}/')
+        self.assertTotalsUpToDate()
+
+    def test_deleting_the_author(self):
+        recipe = self.create_recipe()
+        own = self.create_recipe(author=self.user, amounts=(1, 1))
+        self.add_to_cart(recipe, own)
+        response = self.client_for(self.author).delete(
+            f'/api/users/{self.author.pk}/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertTotalsUpToDate()
+        download = self.client.get(
+            '/api/recipes/download_shopping_cart/?format=json'
+        )
+        self.assertEqual(
+            json.loads(b''.join(download.streaming_content)),
+            [
+                {'name': 'ingredient 0', 'measurement_unit': 'g', 'amount': 1},
+                {'name': 'ingredient 1', 'measurement_unit': 'g', 'amount': 1},
+            ]
+        )
+
+    def login_admin(self):
+        """Log in as a superuser.
+
+        Autocomplete widgets and delete confirmations of the admin look
+        rows up one by one, so the admin tests run without query budgets.
+        """
+        admin = User.objects.create_superuser(
+            username='admin',
+            email='admin@example.com',
+            password='password'
+        )
+        self.client.force_login(admin)
+
+    def admin_form_data(self, response):
+        """POST data of an admin change form as it was rendered."""
+        forms = [response.context['adminform'].form]
+        for inline in response.context['inline_admin_formsets']:
+            forms.append(inline.formset.management_form)
+            forms.extend(inline.formset.forms)
+        data = {}
+        for form in forms:
+            for name in form.fields:
+                value = form[name].value()
+                if value is not None and name != 'image':
+                    data[form.add_prefix(name)] = value
+        return data
+
+    @override_settings(QUERY_BUDGET_MODE='off')
+    def test_admin_recipe_inline(self):
+        recipe = self.create_recipe()
+        self.add_to_cart(recipe)
+        self.login_admin()
+        url = f'/admin/recipes/recipe/{recipe.pk}/change/'
+        data = self.admin_form_data(self.client.get(url))
+        data.update({
+            'recipe_ingredients-0-amount': 11,
+            'recipe_ingredients-1-DELETE': 'on',
+            'recipe_ingredients-3-ingredient': self.ingredients[5].pk,
+            'recipe_ingredients-3-amount': 4,
+        })
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            sorted(recipe.recipe_ingredients.values_list('amount', flat=True)),
+            [4, 11, 30]
+        )
+        self.assertTotalsUpToDate()
+
+    @override_settings(QUERY_BUDGET_MODE='off')
+    def test_admin_changes(self):
+        first, second, third = (self.create_recipe() for _ in range(3))
+        self.add_to_cart(first, second, third)
+        self.login_admin()
+
+        line = first.recipe_ingredients.get(ingredient=self.ingredients[0])
+        self.client.post(
+            f'/admin/recipes/recipeingredient/{line.pk}/change/',
+            {
+                'recipe': second.pk,
+                'ingredient': self.ingredients[4].pk,
+                'amount': 7
+            }
+        )
+        self.assertEqual(
+            models.RecipeIngredient.objects.get(pk=line.pk).recipe_id,
+            second.pk
+        )
+        self.assertTotalsUpToDate()
+
+        self.client.post(
+            '/admin/recipes/recipeingredient/',
+            {
+                'action': 'delete_selected',
+                '_selected_action': [
+                    line.pk for line in third.recipe_ingredients.all()[:2]
+                ],
+                'post': 'yes'
+            }
+        )
+        self.assertEqual(third.recipe_ingredients.count(), 1)
+        self.assertTotalsUpToDate()
+
+        self.client.post(
+            f'/admin/recipes/recipe/{second.pk}/delete/',
+            {'post': 'yes'}
+        )
+        self.assertFalse(models.Recipe.objects.filter(pk=second.pk).exists())
+        self.assertTotalsUpToDate()
+
+        self.client.post(
+            '/admin/recipes/shoprecipe/',
+            {
+                'action': 'delete_selected',
+                '_selected_action': list(models.ShopRecipe.objects.filter(
+                    recipe=third
+                ).values_list('pk', flat=True)),
+                'post': 'yes'
+            }
+        )
+        self.assertFalse(models.ShopRecipe.objects.filter(
+            recipe=third
+        ).exists())
+        self.assertTotalsUpToDate()
+
+
+class FollowStatsTests(APITestCase):
+    """Follow counters stay in step with the subscriptions."""
+
+    def counts(self, user):
+        data = self.client.get(f'/api/users/{user.pk}/').data
+        return data['followers_count'], data['following_count']
+
+    def test_deleting_a_user(self):
+        reader = User.objects.create_user(
+            username='reader',
+            email='reader@example.com',
+            password='password'
+        )
+        reader_client = self.client_for(reader)
+        for client, author in (
+            (self.client, self.author),
+            (reader_client, self.author),
+            (self.client, reader),
+            (reader_client, self.user),
+        ):
+            response = client.post(f'/api/users/{author.pk}/subscribe/')
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.counts(self.author), (2, 0))
+        self.assertEqual(self.counts(self.user), (1, 2))
+
+        response = reader_client.delete(f'/api/users/{reader.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.counts(self.author), (1, 0))
+        self.assertEqual(self.counts(self.user), (0, 1))
+
+    def test_reconcile(self):
+        self.client.post(f'/api/users/{self.author.pk}/subscribe/')
+        models.FollowStats.objects.update(
+            followers_count=5,
+            following_count=5
+        )
+        out = StringIO()
+        call_command('reconcilefollows', stdout=out)
+        self.assertEqual(out.getvalue(), 'Follow counters corrected: 2.\n')
+        self.assertEqual(self.counts(self.author), (1, 0))
+        self.assertEqual(self.counts(self.user), (0, 1))
+
+
+class PaginationTests(APITestCase):
+    """Cached and estimated counts never hide rows."""
+
+    def recipe_body(self, name):
+        return {
+            'ingredients': [{'id': self.ingredients[0].pk, 'amount': 1}],
+            'tags': [self.tags[0].pk],
+            'name': name,
+            'text': 'text',
+            'cooking_time': 5
+        }
+
+    def test_create_then_list(self):
+        anonymous = APIClient()
+        for client in (self.client, anonymous):
+            response = client.get('/api/recipes/')
+            self.assertEqual(response.json()['count'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            for name in ('first', 'second'):
+                response = self.client.post(
+                    '/api/recipes/',
+                    self.recipe_body(name),
+                    format='json'
+                )
+                self.assertEqual(response.status_code, 201)
+        for client in (self.client, anonymous):
+            data = client.get('/api/recipes/').json()
+            self.assertEqual(data['count'], 2)
+            self.assertEqual(
+                [recipe['name'] for recipe in data['results']],
+                ['second', 'first']
+            )
+
+    def test_favorite_then_list(self):
+        recipe = self.create_recipe()
+        url = '/api/recipes/?is_favorited=1'
+        self.assertEqual(self.client.get(url).data['count'], 0)
+        self.client.post(f'/api/recipes/{recipe.pk}/favorite/')
+        response = self.client.get(url)
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_stale_count(self):
+        self.create_recipe()
+        self.assertEqual(self.client.get('/api/recipes/').data['count'], 1)
+        # Written without committing, so the cached count is not dropped.
+        for _ in range(4):
+            self.create_recipe()
+        response = self.client.get('/api/recipes/?limit=2')
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['next'])
+        response = self.client.get('/api/recipes/?limit=2&page=3')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['count'], 5)
+        self.assertIsNone(response.data['next'])
+        response = self.client.get('/api/recipes/?limit=2&page=4')
+        self.assertEqual(response.status_code, 404)
+
+
+class RecipeFastSerializerTests(APITestCase):
+    """The fast read path renders exactly what RecipeSerializer does."""
+
+    def render(self, serializer_class, renderer_class, queryset, user):
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = user
+        data = serializer_class(
+            queryset,
+            many=True,
+            context={'request': request}
+        ).data
+        return renderer_class().render(data)
+
+    def test_same_bytes(self):
+        first = self.create_recipe(name='Борщ \u2028 "soup"')
+        second = self.create_recipe(amounts=(1,))
+        self.create_recipe(author=self.user, amounts=(5, 6))
+        unitless = models.Ingredient.objects.create(
+            name='salt',
+            measurement_unit=None
+        )
+        models.RecipeIngredient.objects.create(
+            recipe=second,
+            ingredient=unitless,
+            amount=2
+        )
+        self.client.post(f'/api/recipes/{first.pk}/favorite/')
+        self.client.post(f'/api/recipes/{second.pk}/shopping_cart/')
+        self.client.post(f'/api/users/{self.author.pk}/subscribe/')
+        cache.clear()
+        for user in (self.user, self.author):
+            queryset = recipe_queryset(user)
+            expected = self.render(
+                serializers.RecipeSerializer,
+                JSONRenderer,
+                queryset,
+                user
+            )
+            self.assertIn(b'"measurement_unit":null', expected)
+            self.assertEqual(
+                self.render(
+                    serializers.RecipeFastSerializer,
+                    renderers.ORJSONRenderer,
+                    queryset,
+                    user
+                ),
+                expected
+            )
+
+
+@override_settings(QUERY_BUDGET_MODE='raise')
+class QueryBudgetTests(APITestCase):
+    """Requests over their query budget fail the test making them."""
+
+    def test_over_budget(self):
+        recipe = self.create_recipe()
+        client = self.client_for(self.user)
+        with mock.patch.dict(RecipeViewSet.query_budgets, retrieve=1):
+            with self.assertRaises(middleware.QueryBudgetExceeded) as error:
+                client.get(f'/api/recipes/{recipe.pk}/')
+        self.assertRegex(
+            str(error.exception),
+            r'^GET api:recipes-detail: \d+ queries, the budget is 1\.$'
+        )
+
+    def test_repeated_statement(self):
+        recorder = middleware.QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for tag in self.tags:
+                models.Tag.objects.get(pk=tag.pk)
+        budget = middleware.QueryBudgetMiddleware(lambda request: None)
+        with self.assertRaises(middleware.QueryBudgetExceeded) as error:
+            budget.report(RequestFactory().get('/api/tags/'), recorder)
+        self.assertIn(
+            '/api/tags/: 3 times from api/tests.py:',
+            str(error.exception)
+        )
+        self.assertIn('in test_repeated_statement', str(error.exception))
+
+    def test_streamed_queries(self):
+        self.client.post(
+            f'/api/recipes/{self.create_recipe().pk}/shopping_cart/'
+        )
+        client = self.client_for(self.user)
+        url = '/api/recipes/download_shopping_cart/?format=txt'
+        labels = {
+            'view': 'api:recipes-download-shopping-cart',
+            'method': 'GET'
+        }
+        before = metrics.REGISTRY.get_sample_value(
+            'foodgram_request_db_queries_sum',
+            labels
+        ) or 0
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        with CaptureQueriesContext(connection) as streamed:
+            content = b''.join(response.streaming_content)
+        self.assertEqual(
+            content,
+            b'-ingredient 0(g)-10\n-ingredient 1(g)-20\n-ingredient 2(g)-30\n'
+        )
+        # Counted now, the next request clears the query log.
+        counted = len(queries)
+        self.assertEqual(len(streamed), 1)
+        self.assertEqual(
+            metrics.REGISTRY.get_sample_value(
+                'foodgram_request_db_queries_sum',
+                labels
+            ) - before,
+            counted + 1
+        )
+        with mock.patch.dict(
+            RecipeViewSet.query_budgets,
+            download_shopping_cart=counted
+        ):
+            response = client.get(url)
+            with self.assertRaisesMessage(
+                middleware.QueryBudgetExceeded,
+                f'{counted + 1} queries, the budget is {counted}.'
+            ):
+                b''.join(response.streaming_content)
+
+
+class RecipeReadQueryTests(APITestCase):
+    """Recipe pages cost the same number of queries whatever they hold."""
+
+    def create_recipes(self, authors, amounts):
+        recipes = [
+            self.create_recipe(author=author, amounts=amounts)
+            for author in authors
+        ]
+        for recipe in recipes[::2]:
+            models.FavoriteRecipe.objects.create(user=self.user, recipe=recipe)
+            models.ShopRecipe.objects.create(user=self.user, recipe=recipe)
+        return recipes
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_list_whatever_the_limit(self):
+        self.create_recipes([self.author, self.user] * 6, (10, 20, 30))
+        for fast_read in (True, False):
+            with self.settings(RECIPE_FAST_READ=fast_read):
+                counts = {
+                    limit: self.count_queries(f'/api/recipes/?limit={limit}')
+                    for limit in (1, 6, 11)
+                }
+                self.assertEqual(len(set(counts.values())), 1, counts)
+
+    def test_page_whatever_the_recipes(self):
+        plain = self.create_recipes([self.author] * 4, (10, ))[0]
+        others = [
+            User.objects.create_user(
+                username=f'other{number}',
+                email=f'other{number}@example.com',
+                password='password'
+            )
+            for number in range(3)
+        ]
+        for fast_read in (True, False):
+            with self.settings(RECIPE_FAST_READ=fast_read):
+                before = [
+                    self.count_queries('/api/recipes/?limit=3'),
+                    self.count_queries(f'/api/recipes/{plain.pk}/')
+                ]
+                rich = self.create_recipes(others, (1, 2, 3, 4, 5, 6))[0]
+                self.assertEqual(
+                    [
+                        self.count_queries('/api/recipes/?limit=3'),
+                        self.count_queries(f'/api/recipes/{rich.pk}/')
+                    ],
+                    before
+                )
+
+
+class RecipeWriteQueryTests(APITestCase):
+    """Writing a recipe costs a fixed number of queries."""
+
+    def body(self, ingredients, tags, amount=1):
+        return {
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': amount}
+                for ingredient in ingredients
+            ],
+            'tags': [tag.pk for tag in tags],
+            'name': 'soup',
+            'text': 'text',
+            'cooking_time': 5
+        }
+
+    def test_create_and_update(self):
+        unit = models.MeasurementUnit.objects.get()
+        ingredients = self.ingredients + [
+            models.Ingredient.objects.create(
+                name=f'extra {number}',
+                measurement_unit=unit
+            )
+            for number in range(24)
+        ]
+        # The search vector is only maintained on PostgreSQL.
+        search = connection.vendor == 'postgresql'
+        for size, tags in ((1, self.tags[:1]), (30, self.tags)):
+            with self.assertNumQueries(14 + search):
+                response = self.client.post(
+                    '/api/recipes/',
+                    self.body(ingredients[:size], tags),
+                    format='json'
+                )
+            self.assertEqual(response.status_code, 201)
+            pk = response.data['id']
+            for count, changed in ((30, self.tags[1:]), (1, self.tags[:1])):
+                with self.assertNumQueries(22 + search):
+                    response = self.client.put(
+                        f'/api/recipes/{pk}/',
+                        self.body(ingredients[-count:], changed, count + 1),
+                        format='json'
+                    )
+                self.assertEqual(response.status_code, 200)
+
+
+class RecipeFilterTests(APITestCase):
+    """Recipe filters return each recipe once, along indexes."""
+
+    def setUp(self):
+        super().setUp()
+        self.recipes = [self.create_recipe() for _ in range(3)]
+        for recipe in self.recipes[:2]:
+            models.FavoriteRecipe.objects.create(user=self.user, recipe=recipe)
+            models.ShopRecipe.objects.create(user=self.user, recipe=recipe)
+
+    def test_several_tags(self):
+        self.recipes[2].tags.set(self.tags[2:])
+        data = self.client.get('/api/recipes/?tags=t0&tags=t1&tags=t2').data
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(
+            [recipe['id'] for recipe in data['results']],
+            [recipe.pk for recipe in reversed(self.recipes)]
+        )
+
+    def test_tag_created_elsewhere(self):
+        response = self.client.get('/api/recipes/?tags=t0')
+        self.assertEqual(response.data['count'], 3)
+        # Added without signals, like a tag created in another worker.
+        tag, = models.Tag.objects.bulk_create(
+            [models.Tag(name='new', slug='new')]
+        )
+        models.RecipeTag.objects.create(recipe=self.recipes[0], tag=tag)
+        data = self.client.get('/api/recipes/?tags=new').data
+        self.assertEqual(
+            [recipe['id'] for recipe in data['results']],
+            [self.recipes[0].pk]
+        )
+
+    def explain(self, queryset):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    @skipUnless(connection.vendor == 'postgresql', 'PostgreSQL plans')
+    def test_tags_index(self):
+        queryset = filters.RecipeFilter(
+            QueryDict('tags=t0&tags=t1'),
+            queryset=models.Recipe.objects.order_by()
+        ).qs
+        self.assertIn(
+            'Index Scan on recipetag_tag_recipe',
+            self.explain(queryset)
+        )
+
+    @skipUnless(connection.vendor == 'postgresql', 'PostgreSQL plans')
+    def test_user_indexes(self):
+        queryset = recipe_queryset(self.user)
+        for field, index in (
+            ('is_favorited', 'unique_favorited'),
+            ('is_in_shopping_cart', 'unique_shopping'),
+        ):
+            plan = self.explain(queryset.filter(**{field: True})[:10])
+            self.assertIn(f'Index Only Scan using {index}', plan)
+
+
+class RecipeSearchTests(APITestCase):
+    """``?search=`` ranks on PostgreSQL and matches substrings elsewhere."""
+
+    def write(self, name, text, ingredient, pk=None):
+        body = {
+            'ingredients': [{'id': ingredient.pk, 'amount': 1}],
+            'tags': [self.tags[0].pk],
+            'name': name,
+            'text': text,
+            'cooking_time': 5
+        }
+        if pk is None:
+            response = self.client.post('/api/recipes/', body, format='json')
+        else:
+            response = self.client.put(
+                f'/api/recipes/{pk}/',
+                body,
+                format='json'
+            )
+        self.assertIn(response.status_code, (200, 201))
+        return response.data['id']
+
+    def search(self, query):
+        cache.clear()
+        response = self.client.get(f'/api/recipes/?search={query}')
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_search(self):
+        tomato = models.Ingredient.objects.create(
+            name='tomato',
+            measurement_unit=None
+        )
+        plain = self.ingredients[0]
+        # Newest first would be the reverse of the ranking.
+        by_name = self.write('tomato soup', 'hot', plain)
+        by_text = self.write('soup', 'with tomato', plain)
+        by_ingredient = self.write('stew', 'thick', tomato)
+        self.write('salad', 'fresh', plain)
+        found = self.search('tomato')
+        if connection.vendor == 'postgresql':
+            self.assertEqual(found, [by_name, by_text, by_ingredient])
+        else:
+            self.assertCountEqual(found, [by_name, by_text, by_ingredient])
+        self.write('stew', 'thick', plain, pk=by_ingredient)
+        self.assertCountEqual(self.search('tomato'), [by_name, by_text])
+        self.assertEqual(self.search('stew'), [by_ingredient])
+
+
+class CatalogueCacheTests(APITestCase):
+    """Catalogue payloads follow changes made here and in other workers."""
+
+    url = '/api/tags/'
+
+    def tag_slugs(self):
+        return [tag['slug'] for tag in self.client.get(self.url).json()]
+
+    def test_version_bumped_on_commit(self):
+        version = get_version('catalogue')
+        with self.captureOnCommitCallbacks() as callbacks:
+            models.Tag.objects.create(name='new', slug='new')
+        self.assertEqual(get_version('catalogue'), version)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(get_version('catalogue'), version)
+
+    def test_entries_expire(self):
+        self.assertEqual(self.tag_slugs(), ['t0', 't1', 't2'])
+        # Added without signals, like a change made by a worker whose
+        # version bump this process's cache never hears of.
+        models.Tag.objects.bulk_create([models.Tag(name='new', slug='new')])
+        self.assertEqual(self.tag_slugs(), ['t0', 't1', 't2'])
+        later = time.monotonic() + settings.CATALOGUE_CACHE_TIMEOUT + 1
+        with mock.patch('api.cache.time.monotonic', return_value=later):
+            self.assertEqual(self.tag_slugs(), ['t0', 't1', 't2', 'new'])
+
+    def test_ingredient_index_expires(self):
+        index = search.IngredientIndex(settings.CATALOGUE_CACHE_TIMEOUT)
+        self.assertEqual(len(index.search('ingredient', 10)), 6)
+        models.Ingredient.objects.bulk_create([models.Ingredient(
+            name='ingredient new',
+            measurement_unit=self.ingredients[0].measurement_unit
+        )])
+        self.assertEqual(len(index.search('ingredient', 10)), 6)
+        later = time.monotonic() + settings.CATALOGUE_CACHE_TIMEOUT + 1
+        with mock.patch('api.search.time.monotonic', return_value=later):
+            self.assertEqual(len(index.search('ingredient', 10)), 7)
+
+
+class TokenCacheTests(APITestCase):
+    """Tokens are cached only when every worker sees their revocation."""
+
+    url = '/api/users/me/'
+
+    def token_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return sum('authtoken_token' in query['sql'] for query in queries)
+
+    def test_local_cache(self):
+        self.assertEqual(self.token_queries(), 1)
+        self.assertEqual(self.token_queries(), 1)
+        # The version bump waits for a commit, like one made by another
+        # worker that this process's cache would never hear of.
+        Token.objects.filter(user=self.user).delete()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_shared_cache(self):
+        with mock.patch('api.authentication.is_shared', return_value=True):
+            self.assertEqual(self.token_queries(), 1)
+            self.assertEqual(self.token_queries(), 0)
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/auth/token/logout/')
+            self.assertEqual(response.status_code, 204)
+            self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_purge(self):
+        Token.objects.filter(user=self.user).update(
+            created=timezone.now() - timedelta(days=31)
+        )
+        version = get_version('tokens')
+        with self.assertNumQueries(1):
+            call_command('purgetokens', stdout=StringIO())
+        self.assertNotEqual(get_version('tokens'), version)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_profile_edits_keep_tokens(self):
+        with mock.patch('api.authentication.is_shared', return_value=True):
+            self.assertEqual(self.token_queries(), 1)
+            with self.captureOnCommitCallbacks(execute=True):
+                User.objects.create_user(username='new', password='new')
+                response = self.client.patch(
+                    self.url,
+                    {'first_name': 'edited'},
+                    format='json'
+                )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.token_queries(), 0)
+            self.assertEqual(
+                self.client.get(self.url).data['first_name'],
+                'edited'
+            )
+            with self.captureOnCommitCallbacks(execute=True):
+                user = User.objects.get(pk=self.user.pk)
+                user.set_password('changed')
+                user.save()
+            self.assertEqual(self.token_queries(), 1)
+
+
+class FollowingCacheTests(APITestCase):
+    """Followed authors are kept between requests only in a shared cache."""
+
+    def setUp(self):
+        super().setUp()
+        self.url = f'/api/users/{self.author.pk}/'
+
+    def following_queries(self, subscribed):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.data['is_subscribed'], subscribed)
+        return sum('recipes_following' in query['sql'] for query in queries)
+
+    def subscribe(self, method):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.client, method)(f'{self.url}subscribe/')
+        self.assertLess(response.status_code, 300)
+
+    def test_local_cache(self):
+        self.assertEqual(self.following_queries(False), 1)
+        self.subscribe('post')
+        self.assertEqual(self.following_queries(True), 1)
+        self.assertEqual(self.following_queries(True), 1)
+
+    def test_shared_cache(self):
+        with mock.patch('api.serializers.is_shared', return_value=True):
+            self.assertEqual(self.following_queries(False), 1)
+            self.assertEqual(self.following_queries(False), 0)
+            self.subscribe('post')
+            self.assertEqual(self.following_queries(True), 1)
+            self.subscribe('delete')
+            self.assertEqual(self.following_queries(False), 1)
+
+
+class RecipeCursorPaginationTests(APITestCase):
+    """Orderings other than the newest first are refused with a cursor."""
+
+    def test_refused_orderings(self):
+        self.create_recipe(name='tomato soup')
+        for parameter in ('ordering=popular', 'search=tomato'):
+            response = self.client.get(
+                f'/api/recipes/?pagination=cursor&{parameter}'
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(parameter.split('=')[0], response.data)
+
+    def test_pages(self):
+        recipes = [self.create_recipe() for _ in range(3)]
+        response = self.client.get('/api/recipes/?pagination=cursor&limit=2')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [recipes[2].pk, recipes[1].pk]
+        )
+        response = self.client.get(response.data['next'])
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [recipes[0].pk]
+        )
+        self.assertIsNone(response.data['next'])
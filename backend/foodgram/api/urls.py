@@ -16,6 +16,4 @@ urlpatterns = [
     path('', include(router.urls)),
     path('auth/', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
-    # path('auth/token/login/', views.get_token, name='get_token'),
-    # path('auth/token/logout/', views.logout_token, name='logout_token'),
 ]
@@ -1,57 +1,199 @@
-from django.http import HttpResponse
-from django.db.models import Sum
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404, StreamingHttpResponse
+from django.db.models import (Count, Exists, F, OuterRef, Prefetch, Value,
+                              Window)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status, viewsets
-from rest_framework.authtoken.models import Token
-from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
-from api import filters, mixins, serializers, paginators
+from api import filters, mixins, paginators, renderers, search, serializers
+from api.cache import bump_version
 from recipes import models
 
 
-class IngredientViewSet(mixins.RetrieveListViewSet):
+RECIPE_MINIFIED_FIELDS = (
+    'id',
+    'name',
+    'image',
+    'image_thumbnails',
+    'cooking_time'
+)
+AUTHOR_FIELDS = ('id', 'email', 'username', 'first_name', 'last_name')
+
+
+def target_id(pk):
+    """Primary key from the URL, or 404 if it is not a number."""
+    try:
+        return int(pk)
+    except (TypeError, ValueError):
+        raise Http404
+
+
+def recipe_queryset(user):
+    """Recipes with everything the recipe serializers read loaded upfront."""
+    queryset = models.Recipe.objects.select_related(
+        'author__follow_stats'
+    ).prefetch_related(
+        'tags',
+        Prefetch(
+            'recipe_ingredients',
+            queryset=models.RecipeIngredient.objects.select_related(
+                'ingredient__measurement_unit'
+            )
+        )
+    )
+    if user.is_authenticated:
+        return queryset.annotate(
+            is_favorited=Exists(models.FavoriteRecipe.objects.filter(
+                user=user,
+                recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(models.ShopRecipe.objects.filter(
+                user=user,
+                recipe=OuterRef('pk')
+            ))
+        )
+    return queryset.annotate(
+        is_favorited=Value(False),
+        is_in_shopping_cart=Value(False)
+    )
+
+
+def attach_recipe_previews(authors, limit=None):
+    """Load the preview recipes of every author with a single query.
+
+    With a limit the recipes are ranked per author with ROW_NUMBER, so
+    only the first ``limit`` recipes of each author leave the database.
+    """
+    recipes = models.Recipe.objects.filter(author__in=authors)
+    if limit is not None:
+        ranked = recipes.order_by().annotate(
+            author_rank=Window(
+                expression=RowNumber(),
+                partition_by=F('author'),
+                order_by=(F('pub_date').desc(), F('id').desc())
+            )
+        ).values('id', 'author_rank')
+        sql, params = ranked.query.sql_with_params()
+        recipes = models.Recipe.objects.filter(pk__in=RawSQL(
+            f'SELECT id FROM ({sql}) AS ranked WHERE author_rank <= %s',
+            (*params, limit)
+        ))
+    previews = {}
+    for recipe in recipes.order_by('-pub_date', '-id'):
+        previews.setdefault(recipe.author_id, []).append(recipe)
+    for author in authors:
+        author.recipes_preview = previews.get(author.id, [])
+
+
+class IngredientViewSet(mixins.CatalogueCacheMixin,
+                        mixins.RetrieveListViewSet):
     """Processing of operations with ingredients."""
 
-    queryset = models.Ingredient.objects.all()
+    queryset = models.Ingredient.objects.select_related('measurement_unit')
     serializer_class = serializers.IngredientListSerializer
     pagination_class = (None)
     permission_classes = (AllowAny, )
     filter_backends = (DjangoFilterBackend,)
     filterset_class = filters.IngredientFilter
+    query_budgets = {'list': 2, 'retrieve': 2}
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action == 'list' and self.request.query_params.get('name'):
+            return queryset[:settings.INGREDIENT_SEARCH_LIMIT]
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name and settings.INGREDIENT_SEARCH_IN_MEMORY:
+            ingredients = search.ingredient_index.search(
+                name,
+                settings.INGREDIENT_SEARCH_LIMIT
+            )
+            serializer = self.get_serializer(ingredients, many=True)
+            return Response(serializer.data)
+        return super().list(request, *args, **kwargs)
 
 
-class TagViewSet(mixins.RetrieveListViewSet):
+class TagViewSet(mixins.CatalogueCacheMixin, mixins.RetrieveListViewSet):
     """Processing of operations with tags."""
 
     queryset = models.Tag.objects.all()
     serializer_class = serializers.TagSerializer
     pagination_class = (None)
     permission_classes = (AllowAny, )
+    query_budgets = {'list': 2, 'retrieve': 2}
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(mixins.AnonymousCacheMixin, viewsets.ModelViewSet):
     """Processing of operations with recipe."""
 
+    cache_namespace = 'recipes'
     filter_backends = (DjangoFilterBackend,)
     filterset_class = filters.RecipeFilter
     pagination_class = paginators.PageLimitPagination
+    query_budgets = {
+        'list': 8,
+        'retrieve': 5,
+        'create': 17,
+        'update': 29,
+        'partial_update': 29,
+        'destroy': 19,
+        'download_shopping_cart': 2,
+        'feed': 6,
+        'favorite': 8,
+        'shopping_cart': 12,
+        'favorite_bulk': 7,
+        'shopping_cart_bulk': 11,
+    }
+
+    @property
+    def count_strategy(self):
+        """Exact counts for the favorites and the cart, which are small
+        and change with every click."""
+        params = self.request.query_params
+        if params.get('is_favorited') or params.get('is_in_shopping_cart'):
+            return 'exact'
+        return 'estimate'
+
+    @property
+    def paginator(self):
+        """Keyset pagination on ``?pagination=cursor``, pages otherwise."""
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            if params.get('pagination') == 'cursor':
+                if params.get('ordering') == 'popular':
+                    raise ValidationError({'ordering': (
+                        'Popular ordering cannot be used with cursor '
+                        'pagination, favorite counts change between pages.'
+                    )})
+                if params.get('search'):
+                    raise ValidationError({'search': (
+                        'Search cannot be used with cursor pagination, '
+                        'its results are ordered by rank.'
+                    )})
+                self._paginator = paginators.RecipeCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
     def get_queryset(self):
         favorite = self.request.query_params.get('is_favorited')
         shop = self.request.query_params.get('is_in_shopping_cart')
-        queryset = models.Recipe.objects.all()
+        queryset = recipe_queryset(self.request.user)
         if favorite:
-            queryset = queryset.filter(
-                favorite_recipe__user=self.request.user
-            )
+            queryset = queryset.filter(is_favorited=True)
         if shop:
-            queryset = queryset.filter(
-                shopping__user=self.request.user
-            )
+            queryset = queryset.filter(is_in_shopping_cart=True)
         return queryset
 
     def get_permissions(self):
@@ -64,72 +206,247 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def get_serializer_class(self):
         if self.action in ('create', 'update', 'partial_update'):
             return serializers.RecipeWriteSerializer
+        if (
+            settings.RECIPE_FAST_READ
+            and self.action in ('list', 'retrieve', 'feed')
+            and self.request.accepted_renderer.format == 'json'
+        ):
+            return serializers.RecipeFastSerializer
         return serializers.RecipeSerializer
 
+    def _reload(self, serializer):
+        serializer.instance = recipe_queryset(self.request.user).get(
+            pk=serializer.instance.pk
+        )
+
     def perform_create(self, serializer):
         serializer.save(
             author=self.request.user
         )
+        self._reload(serializer)
 
-    def _recipes_list(self, request, serializer, model):
-        user = self.request.user
-        recipe = get_object_or_404(models.Recipe, id=self.kwargs.get('pk'))
+    def perform_update(self, serializer):
+        serializer.save()
+        self._reload(serializer)
+
+    def _toggle_recipe(self, request, pk, model, on_change, errors):
+        """Add the recipe to one of the user's lists or remove it.
+
+        ``on_change(recipe_id, delta)`` keeps dependent counters in step;
+        ``errors`` are the messages for an existing and a missing link.
+        """
+        recipe_id = target_id(pk)
         if request.method == 'POST':
-            data = {}
-            data['user'] = user.id
-            data['recipe'] = recipe.pk
-            serializer = serializer(data=data)
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-            serializer = self.get_serializer(recipe)
-            return Response(serializer.data)
-        if request.method == 'DELETE':
-            current_recipe = get_object_or_404(
-                model,
-                user=user,
-                recipe=recipe
+            recipe, created = model.objects.link(
+                request.user,
+                recipe_id,
+                RECIPE_MINIFIED_FIELDS
             )
-            current_recipe.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-
-    @action(detail=False, methods=['get'], name='download')
+            if recipe is None:
+                raise Http404('No Recipe matches the given query.')
+            if not created:
+                return Response(
+                    {'errors': errors[0]},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            on_change(recipe_id, 1)
+            serializer = serializers.RecipeSubSerializer(
+                recipe,
+                context=self.get_serializer_context()
+            )
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        if not model.objects.unlink(request.user, recipe_id):
+            get_object_or_404(models.Recipe, pk=recipe_id)
+            return Response(
+                {'errors': errors[1]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        on_change(recipe_id, -1)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def _toggle_recipes(self, request, model, on_change):
+        """Bulk version of ``_toggle_recipe`` with a status per id."""
+        serializer = serializers.RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = list(dict.fromkeys(serializer.validated_data['ids']))
+        if request.method == 'POST':
+            created = model.objects.link_many(request.user, recipe_ids)
+            changed = [pk for pk, is_new in created.items() if is_new]
+            results = [
+                {
+                    'id': pk,
+                    'status': (
+                        'not_found' if pk not in created
+                        else 'added' if created[pk] else 'exists'
+                    )
+                }
+                for pk in recipe_ids
+            ]
+            delta = 1
+        else:
+            changed = model.objects.unlink_many(request.user, recipe_ids)
+            results = [
+                {'id': pk, 'status': 'removed' if pk in changed else 'absent'}
+                for pk in recipe_ids
+            ]
+            delta = -1
+        if changed:
+            on_change(changed, delta)
+        return Response({'results': results})
+
+    @action(
+        detail=False,
+        methods=['get'],
+        name='download',
+        renderer_classes=(
+            renderers.ShoppingCartTextRenderer,
+            renderers.ShoppingCartCSVRenderer,
+            renderers.ShoppingCartJSONRenderer,
+        )
+    )
     def download_shopping_cart(self, request):
         user = request.user
-        shopping_cart = models.Recipe.objects.filter(
-            shopping__user=user
+        shopping_cart = models.ShopIngredient.objects.filter(
+            user=user
         ).values_list(
-            'ingredients__ingredient__name',
-            'ingredients__ingredient__measurement_unit__name'
-        ).annotate(amount=Sum('ingredients__amount'))
-        response = HttpResponse(content_type='text/plain')
-        response['Content-Disposition'] = 'attachment; filename="sc.txt"'
-        for name, mu, amount in shopping_cart:
-            response.write(f'-{name}({mu})-{amount}\n')
+            'ingredient__name',
+            'ingredient__measurement_unit__name',
+            'amount'
+        ).order_by('ingredient__name')
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(shopping_cart.iterator(chunk_size=500)),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}'
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="sc.{renderer.format}"'
+        )
         return response
 
+    @action(detail=False, methods=['get'], name='feed')
+    def feed(self, request):
+        """Latest recipes of the authors the user follows.
+
+        Merged on read from Following by default, or read from the
+        inbox filled on write when RECIPE_FEED_MODE is ``write``.
+        """
+        user = request.user
+        if models.FeedEntry.objects.enabled():
+            self._paginator = paginators.FeedCursorPagination()
+            entries = self.paginate_queryset(
+                models.FeedEntry.objects.filter(user=user)
+            )
+            recipes = recipe_queryset(user).in_bulk(
+                [entry.recipe_id for entry in entries]
+            )
+            page = [
+                recipes[entry.recipe_id] for entry in entries
+                if entry.recipe_id in recipes
+            ]
+        else:
+            self._paginator = paginators.RecipeCursorPagination()
+            page = self.paginate_queryset(
+                recipe_queryset(user).filter(
+                    author__in=models.Following.objects.filter(
+                        user=user
+                    ).values('author')
+                )
+            )
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
     @action(detail=True, methods=['post', 'delete'], name='favorite')
+    @transaction.atomic
     def favorite(self, request, pk=None):
         """Processing of operations with favorite."""
-        return self._recipes_list(
+        return self._toggle_recipe(
             request,
-            serializers.FavoritedSerializer,
-            models.FavoriteRecipe
+            pk,
+            models.FavoriteRecipe,
+            lambda recipe_id, delta: models.Recipe.objects.filter(
+                pk=recipe_id
+            ).add_favorites(delta),
+            (
+                'The recipe is already in favorites!',
+                'The recipe is not in favorites!'
+            )
         )
 
     @action(detail=True, methods=['post', 'delete'], name='favorite')
+    @transaction.atomic
     def shopping_cart(self, request, pk=None):
         """Processing of operations with the cart."""
-        return self._recipes_list(
+        return self._toggle_recipe(
             request,
-            serializers.ShoppingCartSerializer,
-            models.ShopRecipe
+            pk,
+            models.ShopRecipe,
+            lambda recipe_id, delta: models.ShopIngredient.objects.add_recipe(
+                request.user,
+                recipe_id,
+                delta
+            ),
+            (
+                'The recipe is already in the shopping cart!',
+                'The recipe is not in the shopping cart!'
+            )
+        )
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='favorite/bulk',
+        url_name='favorite-bulk'
+    )
+    @transaction.atomic
+    def favorite_bulk(self, request):
+        """Add or remove several favorites at once."""
+        return self._toggle_recipes(
+            request,
+            models.FavoriteRecipe,
+            lambda recipe_ids, delta: models.Recipe.objects.filter(
+                pk__in=recipe_ids
+            ).add_favorites(delta)
+        )
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        url_path='shopping_cart/bulk',
+        url_name='shopping-cart-bulk'
+    )
+    @transaction.atomic
+    def shopping_cart_bulk(self, request):
+        """Add or remove several recipes of the cart at once."""
+        return self._toggle_recipes(
+            request,
+            models.ShopRecipe,
+            lambda recipe_ids, delta: (
+                models.ShopIngredient.objects.add_recipes(
+                    request.user,
+                    recipe_ids,
+                    delta
+                )
+            )
         )
 
 
 class UserViewSet(viewsets.ModelViewSet):
     """Processing of operations with users."""
 
-    queryset = serializers.User.objects.all()
+    queryset = serializers.User.objects.select_related(
+        'follow_stats'
+    ).order_by('id')
+    query_budgets = {
+        'list': 4,
+        'retrieve': 3,
+        'create': 3,
+        'update': 5,
+        'partial_update': 4,
+        'destroy': 32,
+        'set_password': 1,
+        'subscriptions': 4,
+        'subscribe': 11,
+    }
 
     def get_serializer_class(self):
         pk = self.kwargs.get('pk')
@@ -154,7 +471,11 @@ class UserViewSet(viewsets.ModelViewSet):
         if self.request.path == reverse(
             'api:users-detail', kwargs={'pk': 'me'}
         ):
-            return self.request.user
+            # The user of a cached token is not reloaded on profile edits.
+            return get_object_or_404(
+                self.get_queryset(),
+                pk=self.request.user.pk
+            )
         return super().get_object()
 
     @action(detail=False, methods=['post'], name='set_password')
@@ -172,60 +493,63 @@ class UserViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'], name='subscriptions')
     def subscriptions(self, request):
         user = request.user
+        limit = request.query_params.get('recipes_limit')
         following = models.User.objects.filter(
             following__user=user
-        )
+        ).annotate(
+            is_subscribed=Value(True),
+            recipes_count=Count('recipes')
+        ).order_by('id')
         paginator = self.paginate_queryset(following)
+        attach_recipe_previews(paginator, int(limit) if limit else None)
         serializer = self.get_serializer(paginator, many=True)
         return self.get_paginated_response(serializer.data)
 
     @action(detail=True, methods=['post', 'delete'], name='follow')
+    @transaction.atomic
     def subscribe(self, request, pk=None):
         """Processing of operations with subscriptions."""
         user = self.request.user
-        author = get_object_or_404(models.User, id=self.kwargs.get('pk'))
+        author_id = target_id(pk)
         if request.method == 'POST':
-            data = {}
-            data['user'] = user.id
-            data['author'] = author.id
-            serializer = serializers.FollowingSerializer(data=data)
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
+            if author_id == user.id:
+                return Response(
+                    {'errors': "You can't subscribe to yourself!"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            author, created = models.Following.objects.link(
+                user,
+                author_id,
+                AUTHOR_FIELDS
+            )
+            if author is None:
+                raise Http404('No User matches the given query.')
+            if not created:
+                return Response(
+                    {'errors': 'You are already subscribed to this author!'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            self._follow_changed(user, author_id, 1)
+            limit = request.query_params.get('recipes_limit')
+            author.is_subscribed = True
+            attach_recipe_previews([author], int(limit) if limit else None)
             serializer = self.get_serializer(instance=author)
-            return Response(serializer.data)
-        if request.method == 'DELETE':
-            subscribe = get_object_or_404(
-                models.Following,
-                user=user,
-                author=author
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        if not models.Following.objects.unlink(user, author_id):
+            get_object_or_404(models.User, pk=author_id)
+            return Response(
+                {'errors': 'You are not subscribed to this author!'},
+                status=status.HTTP_400_BAD_REQUEST
             )
-            subscribe.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-
+        self._follow_changed(user, author_id, -1)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
-@api_view(['POST'])
-@permission_classes([AllowAny])
-def get_token(request):
-    """Token creation."""
-
-    email = request.data.get('email')
-    password = request.data.get('password')
-
-    if None not in (email, password):
-        user = get_object_or_404(
-            serializers.User,
-            email=email,
-            password=password
+    def _follow_changed(self, user, author_id, delta):
+        models.FollowStats.objects.follow(user, author_id, delta)
+        if delta > 0:
+            models.FeedEntry.objects.follow(user, author_id)
+        else:
+            models.FeedEntry.objects.unfollow(user, author_id)
+        transaction.on_commit(
+            lambda: bump_version(f'following:{user.pk}')
         )
-        token = Token.objects.create(user=user)
-        return Response({'auth_token': str(token.key), })
-    return Response(request.data, status=status.HTTP_400_BAD_REQUEST)
-
-
-@api_view(['POST'])
-@permission_classes([IsAuthenticated])
-def logout_token(request):
-    """Logout token creation."""
-    token = Token.objects.get(user=request.user)
-    token.delete()
-    return Response(status=status.HTTP_204_NO_CONTENT)
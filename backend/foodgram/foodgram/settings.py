@@ -30,6 +30,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -100,12 +102,83 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+if os.getenv('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_URL'),
+    }
+
+CATALOGUE_CACHE_MAX_ENTRIES = 1000
+
+CATALOGUE_CACHE_TIMEOUT = 60
+
+RESPONSE_CACHE_TIMEOUT = 60
+
+TOKEN_CACHE_MAX_ENTRIES = 10000
+
+TOKEN_CACHE_TIMEOUT = 300
+
+FOLLOWING_CACHE_MAX_ENTRIES = 10000
+
+FOLLOWING_CACHE_TIMEOUT = 60
+
+INGREDIENT_SEARCH_LIMIT = 50
+
+INGREDIENT_SEARCH_IN_MEMORY = (
+    os.getenv('INGREDIENT_SEARCH_IN_MEMORY', default='False') == 'True'
+)
+
+BULK_MAX_ITEMS = 100
+
+PAGINATION_COUNT_CACHE_TIMEOUT = 30
+
+PAGINATION_COUNT_ESTIMATE_THRESHOLD = 10000
+
+RECIPE_IMAGE_MAX_SIZE = 5 * 1024 * 1024
+
+RECIPE_THUMBNAIL_WIDTHS = (320, 640, 1280)
+
+RECIPE_THUMBNAIL_FORMATS = ('webp', 'jpeg')
+
+RECIPE_THUMBNAIL_WORKERS = int(
+    os.getenv('RECIPE_THUMBNAIL_WORKERS', default='2')
+)
+
+RECIPE_FEED_MODE = os.getenv('RECIPE_FEED_MODE', default='read')
+
+RECIPE_FEED_BACKFILL = 100
+
+RECIPE_FEED_BATCH_SIZE = 1000
+
+RECIPE_SEARCH_CONFIG = os.getenv('RECIPE_SEARCH_CONFIG', default='russian')
+
+QUERY_BUDGET_MODE = os.getenv('QUERY_BUDGET_MODE', default='off')
+
+QUERY_REPEAT_THRESHOLD = 3
+
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', default='')
+
+RECIPE_FAST_READ = os.getenv('RECIPE_FAST_READ', default='True') == 'True'
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
 }
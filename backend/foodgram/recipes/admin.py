@@ -2,10 +2,24 @@ from django.contrib import admin
 from django.contrib.auth import get_user_model
 
 from recipes import models
+from recipes.images import schedule_thumbnails
 
 User = get_user_model()
 
 
+class RecipeIngredientInline(admin.TabularInline):
+    """Ingredient amounts edited on the recipe page."""
+
+    model = models.RecipeIngredient
+    autocomplete_fields = ('ingredient', )
+    extra = 1
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'ingredient__measurement_unit'
+        )
+
+
 @admin.register(models.Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     """Parameters of the recipe model display."""
@@ -15,9 +29,22 @@ class RecipeAdmin(admin.ModelAdmin):
         'name',
         'author',
     )
+    inlines = (RecipeIngredientInline, )
     search_fields = ('author', 'name', 'tegs', )
     empty_value_display = '-empty-'
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if 'image' in form.changed_data:
+            schedule_thumbnails(obj)
+
+    def save_related(self, request, form, formsets, change):
+        with models.ShopIngredient.objects.tracking([form.instance.pk]):
+            super().save_related(request, form, formsets, change)
+        models.Recipe.objects.filter(
+            pk=form.instance.pk
+        ).update_search_vector()
+
 
 @admin.register(models.Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
@@ -60,9 +87,57 @@ class UserAdmin(admin.ModelAdmin):
     empty_value_display = '-empty-'
 
 
+@admin.register(models.RecipeIngredient)
+class RecipeIngredientAdmin(admin.ModelAdmin):
+    """Ingredient amounts, with the shopping lists kept in step."""
+
+    def save_model(self, request, obj, form, change):
+        recipes = [obj.recipe_id]
+        if change:
+            recipes.append(form.initial['recipe'])
+        with models.ShopIngredient.objects.tracking(recipes):
+            super().save_model(request, obj, form, change)
+
+    def delete_model(self, request, obj):
+        with models.ShopIngredient.objects.tracking([obj.recipe_id]):
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with models.ShopIngredient.objects.tracking(
+            queryset.values_list('recipe_id', flat=True)
+        ):
+            super().delete_queryset(request, queryset)
+
+
+@admin.register(models.ShopRecipe)
+class ShopRecipeAdmin(admin.ModelAdmin):
+    """Carts, with the shopping lists kept in step.
+
+    Entries can be added and deleted but not moved to another user or
+    recipe.
+    """
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        models.ShopIngredient.objects.add_recipe(obj.user, obj.recipe_id)
+
+    def delete_model(self, request, obj):
+        models.ShopIngredient.objects.add_recipe(obj.user, obj.recipe_id, -1)
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        carts = {}
+        for cart in queryset.select_related('user'):
+            carts.setdefault(cart.user, []).append(cart.recipe_id)
+        for user, recipe_ids in carts.items():
+            models.ShopIngredient.objects.add_recipes(user, recipe_ids, -1)
+        super().delete_queryset(request, queryset)
+
+
 admin.site.register(models.RecipeTag)
-admin.site.register(models.Amount)
 admin.site.register(models.MeasurementUnit)
 admin.site.register(models.Following)
 admin.site.register(models.FavoriteRecipe)
-admin.site.register(models.ShopRecipe)
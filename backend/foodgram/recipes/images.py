@@ -0,0 +1,106 @@
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image
+
+from api.cache import bump_version
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 80, 'optimize': True, 'progressive': True}),
+}
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.RECIPE_THUMBNAIL_WORKERS,
+    thread_name_prefix='thumbnails'
+)
+
+
+def thumbnail_name(name, width, image_format):
+    """Storage name of a thumbnail next to the original image."""
+    directory, filename = posixpath.split(name)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(
+        directory,
+        'thumbnails',
+        f'{stem}_{width}.{image_format}'
+    )
+
+
+def make_thumbnails(name):
+    """Write every configured thumbnail of an image.
+
+    Returns ``{format: {width: storage name}}``.
+    """
+    with default_storage.open(name) as file, Image.open(file) as image:
+        image.load()
+    thumbnails = {}
+    for image_format in settings.RECIPE_THUMBNAIL_FORMATS:
+        pil_format, options = FORMATS[image_format]
+        source = image
+        if pil_format == 'JPEG' and image.mode != 'RGB':
+            source = image.convert('RGB')
+        thumbnails[image_format] = {}
+        for width in settings.RECIPE_THUMBNAIL_WIDTHS:
+            thumbnail = source.copy()
+            thumbnail.thumbnail((width, width * 4))
+            buffer = BytesIO()
+            thumbnail.save(buffer, pil_format, **options)
+            thumbnails[image_format][str(width)] = default_storage.save(
+                thumbnail_name(name, width, image_format),
+                ContentFile(buffer.getvalue())
+            )
+    return thumbnails
+
+
+def names(thumbnails):
+    """Storage names of all the thumbnails of an image."""
+    return {
+        name for sizes in thumbnails.values() for name in sizes.values()
+    }
+
+
+def update_thumbnails(recipe_id, name):
+    """Generate thumbnails and store them on the recipe if its image is
+    still the one they were made from."""
+    close_old_connections()
+    try:
+        thumbnails = make_thumbnails(name)
+        previous = Recipe.objects.filter(
+            pk=recipe_id
+        ).values_list('image_thumbnails', flat=True).first()
+        updated = Recipe.objects.filter(
+            pk=recipe_id,
+            image=name
+        ).update(image_thumbnails=thumbnails)
+        if updated:
+            bump_version('recipes')
+            stale = names(previous or {}) - names(thumbnails)
+        else:
+            stale = names(thumbnails)
+        for stale_name in stale:
+            default_storage.delete(stale_name)
+    except Exception:
+        logger.exception('Unable to make thumbnails of %s', name)
+    finally:
+        close_old_connections()
+
+
+def schedule_thumbnails(recipe):
+    """Make the thumbnails in the background once the recipe is saved."""
+    if not recipe.image:
+        Recipe.objects.filter(pk=recipe.pk).update(image_thumbnails={})
+        return
+    recipe_id, name = recipe.pk, recipe.image.name
+    transaction.on_commit(
+        lambda: executor.submit(update_thumbnails, recipe_id, name)
+    )
@@ -1,31 +1,124 @@
+import csv
 import json
+import time
+from pathlib import Path
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from api.cache import bump_version
 from recipes.models import Ingredient, MeasurementUnit
 
+DEFAULT_PATH = Path(settings.BASE_DIR) / 'recipes' / 'ingredients.json'
+
+
+def read_json(file, chunk_size=1 << 16):
+    """Yield ``(name, measurement_unit)`` from a JSON array of objects
+    without loading the whole document."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    for chunk in iter(lambda: file.read(chunk_size), ''):
+        buffer += chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in '[, \t\r\n':
+                position += 1
+            if position == len(buffer) or buffer[position] == ']':
+                break
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            yield item['name'], item['measurement_unit']
+        buffer = buffer[position:]
+    if buffer.strip() not in ('', ']'):
+        raise CommandError('Malformed JSON at the end of the file.')
+
+
+def read_csv(file):
+    """Yield ``(name, measurement_unit)`` from ``name,unit`` rows."""
+    for row in csv.reader(file):
+        if row:
+            yield row[0], row[1]
+
 
 class Command(BaseCommand):
-    help = 'Loads objects and csv tables to the database.'
-
-    def handle(self, *args, **kwargs):
-
-        path = 'recipes/ingredients.json'
-
-        with open(path) as json_file:
-            data = json.load(json_file)
-            uniq = []
-            for ingr in data:
-                measun = ingr['measurement_unit']
-                if measun not in uniq:
-                    uniq.append(measun)
-                    m = MeasurementUnit(name=measun)
-                    m.save()
-                m = MeasurementUnit.objects.get(name=measun)
-                ingredient = Ingredient(
-                    name=ingr['name'],
-                    measurement_unit=m
-                )
-                ingredient.save()
-
-        self.stdout.write('Objects loaded to the database.')
+    help = (
+        'Loads ingredients from a JSON or CSV file to the database. '
+        'Running servers see them at once if they share the cache with '
+        'this command through REDIS_URL, otherwise once their catalogue '
+        'cache expires after CATALOGUE_CACHE_TIMEOUT seconds.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=DEFAULT_PATH,
+            type=Path,
+            help='JSON or CSV file, the bundled ingredients.json by default.'
+        )
+        parser.add_argument(
+            '--format',
+            choices=('json', 'csv'),
+            help='File format, guessed from the extension if omitted.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Ingredients inserted per INSERT statement.'
+        )
+
+    def handle(self, *args, **options):
+
+        path = options['path']
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in ('json', 'csv'):
+            raise CommandError(f'Unknown file format: {path.suffix}')
+        reader = read_json if file_format == 'json' else read_csv
+        batch_size = options['batch_size']
+
+        started = time.monotonic()
+        rows = 0
+        with open(path, encoding='utf-8') as file, transaction.atomic():
+            existing = Ingredient.objects.count()
+            units = dict(
+                MeasurementUnit.objects.values_list('name', 'id')
+            )
+            batch = []
+            for row in reader(file):
+                batch.append(row)
+                if len(batch) == batch_size:
+                    self._load_batch(batch, units)
+                    rows += len(batch)
+                    batch = []
+            self._load_batch(batch, units)
+            rows += len(batch)
+            created = Ingredient.objects.count() - existing
+        bump_version('catalogue')
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'Objects loaded to the database: {rows} rows read, '
+            f'{created} ingredients created in {elapsed:.2f} s '
+            f'({rows / elapsed if elapsed else rows:.0f} rows/s).'
+        )
+
+    def _load_batch(self, batch, units):
+        new_units = {
+            name for _, name in batch if name not in units
+        }
+        for unit in MeasurementUnit.objects.bulk_create(
+            MeasurementUnit(name=name) for name in new_units
+        ):
+            units[unit.name] = unit.id
+        Ingredient.objects.bulk_create(
+            (
+                Ingredient(name=name, measurement_unit_id=units[unit])
+                for name, unit in batch
+            ),
+            batch_size=len(batch) or None,
+            ignore_conflicts=True
+        )
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import update_thumbnails
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Makes the image thumbnails of existing recipes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Remake thumbnails that already exist as well.'
+        )
+
+    def handle(self, *args, **options):
+
+        recipes = Recipe.objects.exclude(image='').exclude(image=None)
+        if not options['all']:
+            recipes = recipes.filter(image_thumbnails={})
+        made = 0
+        for recipe_id, name in recipes.values_list('id', 'image').iterator():
+            update_thumbnails(recipe_id, name)
+            made += 1
+        self.stdout.write(f'Thumbnails made for {made} recipes.')
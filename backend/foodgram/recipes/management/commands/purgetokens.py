@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from api.cache import bump_version
+
+
+class Command(BaseCommand):
+    help = 'Deletes auth tokens that are too old or belong to inactive users.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=30,
+            help='Delete tokens created more than this many days ago.'
+        )
+
+    def handle(self, *args, **options):
+
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        tokens = Token.objects.filter(
+            Q(created__lt=cutoff) | Q(user__is_active=False)
+        )
+        # A single DELETE, without loading every token to send its
+        # post_delete signal, and a single bump of the token cache.
+        deleted = tokens._raw_delete(tokens.db)
+        bump_version('tokens')
+        self.stdout.write(f'Tokens deleted: {deleted}.')
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import ShopIngredient
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds or verifies the materialized shopping list totals.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Only report users whose stored totals are out of date.'
+        )
+
+    def handle(self, *args, **options):
+
+        if not options['verify']:
+            ShopIngredient.objects.rebuild()
+            self.stdout.write('Shopping list totals rebuilt.')
+            return
+
+        expected = {
+            (row['user_id'], row['ingredient_id']): (
+                row['total'], row['count']
+            )
+            for row in ShopIngredient.objects.calculate().iterator()
+        }
+        stored = {
+            (user_id, ingredient_id): (amount, recipes_count)
+            for user_id, ingredient_id, amount, recipes_count
+            in ShopIngredient.objects.values_list(
+                'user_id', 'ingredient_id', 'amount', 'recipes_count'
+            ).iterator()
+        }
+        users = sorted({
+            user_id
+            for user_id, ingredient_id in expected.keys() | stored.keys()
+            if expected.get((user_id, ingredient_id))
+            != stored.get((user_id, ingredient_id))
+        })
+        if users:
+            self.stdout.write(
+                f'Shopping list totals differ for users: '
+                f'{", ".join(map(str, users))}. Run without --verify '
+                f'to rebuild them.'
+            )
+        else:
+            self.stdout.write('Shopping list totals are up to date.')
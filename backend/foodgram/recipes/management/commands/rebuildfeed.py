@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import FeedEntry
+
+
+class Command(BaseCommand):
+    help = 'Refills the feed inboxes used when RECIPE_FEED_MODE is write.'
+
+    def handle(self, *args, **options):
+
+        FeedEntry.objects.rebuild()
+        if FeedEntry.objects.enabled():
+            self.stdout.write(
+                f'Feed inboxes rebuilt: {FeedEntry.objects.count()} entries.'
+            )
+        else:
+            self.stdout.write(
+                'Feed inboxes emptied, RECIPE_FEED_MODE is not write.'
+            )
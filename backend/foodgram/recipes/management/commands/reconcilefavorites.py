@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Corrects recipe favorite counters that drifted from the favorites.'
+
+    def handle(self, *args, **options):
+
+        fixed = Recipe.objects.reconcile_favorites_count()
+        self.stdout.write(f'Favorite counters corrected: {fixed}.')
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import FollowStats
+
+
+class Command(BaseCommand):
+    help = 'Corrects follow counters that drifted from the subscriptions.'
+
+    def handle(self, *args, **options):
+
+        fixed = FollowStats.objects.reconcile()
+        self.stdout.write(f'Follow counters corrected: {fixed}.')
@@ -0,0 +1,65 @@
+# Generated by Django 4.1.6 on 2026-10-18 01:40
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+import django.db.models.deletion
+
+
+def fill_shop_ingredients(apps, schema_editor):
+    ShopRecipe = apps.get_model('recipes', 'ShopRecipe')
+    ShopIngredient = apps.get_model('recipes', 'ShopIngredient')
+    totals = ShopRecipe.objects.filter(
+        recipe__ingredients__ingredient__isnull=False
+    ).values(
+        'user_id',
+        'recipe__ingredients__ingredient_id'
+    ).annotate(
+        total=Sum('recipe__ingredients__amount', default=0),
+        count=Count('recipe', distinct=True)
+    ).order_by()
+    ShopIngredient.objects.bulk_create(
+        [
+            ShopIngredient(
+                user_id=row['user_id'],
+                ingredient_id=row['recipe__ingredients__ingredient_id'],
+                amount=row['total'],
+                recipes_count=row['count']
+            )
+            for row in totals.iterator()
+        ],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0002_alter_favoriterecipe_recipe'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShopIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(default=0, verbose_name='Amount')),
+                ('recipes_count', models.PositiveIntegerField(default=0, verbose_name='Recipes')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shop_ingredients', to='recipes.ingredient')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shop_ingredients', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Shopping list total',
+                'verbose_name_plural': 'Shopping list totals',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shopingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shop_ingredient'),
+        ),
+        migrations.RunPython(
+            fill_shop_ingredients,
+            migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.1.6 on 2026-10-18 02:05
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+import django.db.models.functions.text
+
+from recipes.operations import AddPostgresIndex, PostgresTrigramExtension
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_shopingredient'),
+    ]
+
+    operations = [
+        PostgresTrigramExtension(),
+        AddPostgresIndex(
+            model_name='ingredient',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='gin_trgm_ops'), name='ingredient_name_trgm'),
+        ),
+    ]
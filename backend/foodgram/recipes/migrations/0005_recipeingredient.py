@@ -0,0 +1,63 @@
+# Generated by Django 4.1.6 on 2026-10-18 02:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_amounts(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    amounts = {}
+    for recipe_id, ingredient_id, amount in (
+        Recipe.ingredients.through.objects.filter(
+            amount__ingredient__isnull=False
+        ).values_list(
+            'recipe_id',
+            'amount__ingredient_id',
+            'amount__amount'
+        ).iterator()
+    ):
+        key = (recipe_id, ingredient_id)
+        amounts[key] = amounts.get(key, 0) + (amount or 0)
+    RecipeIngredient.objects.bulk_create(
+        [
+            RecipeIngredient(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=amount
+            )
+            for (recipe_id, ingredient_id), amount in amounts.items()
+        ],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_ingredient_name_trgm'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(verbose_name='Amount')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ingredient_recipes', to='recipes.ingredient')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipe_ingredients', to='recipes.recipe')),
+            ],
+            options={
+                'verbose_name': 'Ingredient amount',
+                'verbose_name_plural': 'Ingredient amounts',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='recipeingredient',
+            constraint=models.UniqueConstraint(fields=('recipe', 'ingredient'), name='unique_recipe_ingredient'),
+        ),
+        migrations.RunPython(
+            copy_amounts,
+            migrations.RunPython.noop
+        ),
+    ]
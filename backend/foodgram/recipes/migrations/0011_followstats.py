@@ -0,0 +1,49 @@
+# Generated by Django 4.1.6 on 2026-10-18 06:20
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def count_follows(apps, schema_editor):
+    Following = apps.get_model('recipes', 'Following')
+    FollowStats = apps.get_model('recipes', 'FollowStats')
+    stats = {}
+    for field, counter in (
+        ('author', 'followers_count'),
+        ('user', 'following_count'),
+    ):
+        for row in Following.objects.values(field).annotate(
+            total=Count('id')
+        ).order_by():
+            stats.setdefault(
+                row[field],
+                FollowStats(user_id=row[field])
+            )
+            setattr(stats[row[field]], counter, row['total'])
+    FollowStats.objects.bulk_create(stats.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0010_recipe_image_thumbnails'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FollowStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='follow_stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='User')),
+                ('followers_count', models.IntegerField(default=0, verbose_name='Followers')),
+                ('following_count', models.IntegerField(default=0, verbose_name='Following')),
+            ],
+            options={
+                'verbose_name': 'Follow counters',
+                'verbose_name_plural': 'Follow counters',
+            },
+        ),
+        migrations.RunPython(count_follows, migrations.RunPython.noop),
+    ]
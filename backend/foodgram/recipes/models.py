@@ -1,5 +1,15 @@
+from contextlib import contextmanager
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, SearchVectorField)
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import (Case, Count, Exists, F, OuterRef, Q, Subquery,
+                              Sum, When)
+from django.db.models.functions import Coalesce, Upper
 
 User = get_user_model()
 
@@ -26,6 +36,12 @@ class Ingredient(models.Model):
                 name='unique_ungredient'
             )
         ]
+        indexes = [
+            GinIndex(
+                OpClass(Upper('name'), name='gin_trgm_ops'),
+                name='ingredient_name_trgm'
+            )
+        ]
 
     def __str__(self):
         return self.name
@@ -44,34 +60,6 @@ class MeasurementUnit(models.Model):
         return self.name
 
 
-class Amount(models.Model):
-    """Model for connection between recipe and ingredient."""
-
-    ingredient = models.ForeignKey(
-        Ingredient,
-        related_name='ing_rec',
-        on_delete=models.SET_NULL,
-        blank=True,
-        null=True
-    )
-    amount = models.IntegerField(
-        verbose_name='Amount',
-        blank=True,
-        null=True
-    )
-
-    class Meta:
-        verbose_name = 'Ingredient amount'
-        verbose_name_plural = 'Ingredient amount'
-
-    def __str__(self):
-        return (
-            f'{self.ingredient}, '
-            f'{self.amount}, '
-            f'{self.ingredient.measurement_unit}'
-        )
-
-
 class Tag(models.Model):
     """Tag model."""
 
@@ -111,11 +99,91 @@ class RecipeTag(models.Model):
                 name='unique_recipe_tag'
             )
         ]
+        indexes = [
+            models.Index(fields=['tag', 'recipe'], name='recipetag_tag_recipe')
+        ]
 
     def __str__(self):
         return f'{self.recipe}, {self.tag}'
 
 
+class RecipeQuerySet(models.QuerySet):
+    """Recipe queries for full-text search."""
+
+    def update_search_vector(self):
+        """Recompute the search vector of the selected recipes only.
+
+        Name weighs more than the description, and the description more
+        than the ingredient names. Does nothing outside PostgreSQL.
+        """
+        if connections[self.db].vendor != 'postgresql':
+            return 0
+        config = settings.RECIPE_SEARCH_CONFIG
+        ingredient_names = RecipeIngredient.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            names=StringAgg('ingredient__name', ' ')
+        ).values('names')
+        return self.update(search_vector=(
+            SearchVector('name', weight='A', config=config)
+            + SearchVector('text', weight='B', config=config)
+            + SearchVector(
+                Subquery(ingredient_names),
+                weight='C',
+                config=config
+            )
+        ))
+
+    def add_favorites(self, delta=1):
+        """Change the favorite counters in place, without reading them."""
+        return self.update(favorites_count=F('favorites_count') + delta)
+
+    def reconcile_favorites_count(self):
+        """Fix the counters that drifted from FavoriteRecipe.
+
+        Returns the number of recipes corrected.
+        """
+        counts = Coalesce(
+            Subquery(
+                FavoriteRecipe.objects.filter(
+                    recipe=OuterRef('pk')
+                ).order_by().values('recipe').annotate(
+                    total=Count('id')
+                ).values('total')
+            ),
+            0
+        )
+        stale = self.annotate(actual=counts).exclude(
+            favorites_count=F('actual')
+        )
+        return self.model.objects.filter(
+            pk__in=stale.values('pk')
+        ).update(favorites_count=counts)
+
+    def search(self, query):
+        """Recipes matching ``query``, best matches first.
+
+        Outside PostgreSQL falls back to an unranked substring search.
+        """
+        if connections[self.db].vendor != 'postgresql':
+            return self.filter(
+                Q(name__icontains=query)
+                | Q(text__icontains=query)
+                | Exists(RecipeIngredient.objects.filter(
+                    recipe=OuterRef('pk'),
+                    ingredient__name__icontains=query
+                ))
+            )
+        query = SearchQuery(
+            query,
+            config=settings.RECIPE_SEARCH_CONFIG,
+            search_type='websearch'
+        )
+        return self.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-pub_date', '-id')
+
+
 class Recipe(models.Model):
     """Recipe model."""
 
@@ -131,10 +199,16 @@ class Recipe(models.Model):
         null=True, blank=True,
         verbose_name='Image'
     )
+    image_thumbnails = models.JSONField(
+        default=dict,
+        editable=False,
+        verbose_name='Image thumbnails'
+    )
     text = models.TextField(blank=True, verbose_name='Description')
     ingredients = models.ManyToManyField(
-        Amount,
-        related_name='ingredients',
+        Ingredient,
+        through='RecipeIngredient',
+        related_name='recipes',
         verbose_name='Ingredients',
         blank=True
     )
@@ -145,16 +219,232 @@ class Recipe(models.Model):
     )
     cooking_time = models.IntegerField(verbose_name='Cooking time')
     pub_date = models.DateTimeField(auto_now_add=True, verbose_name='Date')
+    search_vector = SearchVectorField(null=True, editable=False)
+    favorites_count = models.IntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Favorites'
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Recipe'
         verbose_name_plural = 'Recipes'
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_id'
+            ),
+            models.Index(
+                fields=['-favorites_count', '-pub_date', '-id'],
+                name='recipe_popular'
+            ),
+            GinIndex(fields=['search_vector'], name='recipe_search_vector')
+        ]
 
     def __str__(self):
         return self.name
 
 
+class RecipeIngredient(models.Model):
+    """Amount of an ingredient in a recipe."""
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='recipe_ingredients'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='ingredient_recipes'
+    )
+    amount = models.IntegerField(verbose_name='Amount')
+
+    class Meta:
+        verbose_name = 'Ingredient amount'
+        verbose_name_plural = 'Ingredient amounts'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'ingredient'],
+                name='unique_recipe_ingredient'
+            )
+        ]
+
+    def __str__(self):
+        return (
+            f'{self.ingredient}, '
+            f'{self.amount}, '
+            f'{self.ingredient.measurement_unit}'
+        )
+
+
+class UserLinkManager(models.Manager):
+    """Adds and removes a user's link to a target (a recipe or an author)
+    in one statement, relying on the (user, target) unique constraint.
+
+    The statements bypass model signals.
+    """
+
+    def _target_field(self):
+        return next(
+            field for field in self.model._meta.concrete_fields
+            if field.is_relation and field.name != 'user'
+        )
+
+    def link(self, user, target_id, fields=('id', )):
+        """Link ``user`` to the target unless they are linked already.
+
+        Returns ``(target, created)``, where ``target`` is the target
+        with only ``fields`` loaded, or ``None`` if it does not exist.
+        """
+        target_field = self._target_field()
+        target_model = target_field.related_model
+        fields = [
+            field.attname for field in target_model._meta.concrete_fields
+            if field.attname in fields
+        ]
+        connection = connections[self.db]
+        if connection.vendor != 'postgresql':
+            target = target_model.objects.only(*fields).filter(
+                pk=target_id
+            ).first()
+            if target is None:
+                return None, False
+            try:
+                with transaction.atomic(using=self.db):
+                    self.create(user=user, **{target_field.name: target})
+            except IntegrityError:
+                return target, False
+            return target, True
+
+        quote = connection.ops.quote_name
+        columns = [
+            target_model._meta.get_field(name).column for name in fields
+        ]
+        pk_column = quote(target_model._meta.pk.column)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'WITH target AS ('
+                f'SELECT {", ".join(map(quote, columns))} '
+                f'FROM {quote(target_model._meta.db_table)} '
+                f'WHERE {pk_column} = %s), '
+                f'inserted AS ('
+                f'INSERT INTO {quote(self.model._meta.db_table)} '
+                f'({quote(self.model._meta.get_field("user").column)}, '
+                f'{quote(target_field.column)}) '
+                f'SELECT %s, {pk_column} FROM target '
+                f'ON CONFLICT DO NOTHING RETURNING 1) '
+                f'SELECT *, EXISTS(SELECT 1 FROM inserted) FROM target',
+                (target_id, getattr(user, 'pk', user))
+            )
+            row = cursor.fetchone()
+        if row is None:
+            return None, False
+        values = []
+        for name, value in zip(fields, row):
+            field = target_model._meta.get_field(name)
+            if hasattr(field, 'from_db_value'):
+                value = field.from_db_value(value, None, connection)
+            values.append(value)
+        return target_model.from_db(self.db, fields, values), row[-1]
+
+    def link_many(self, user, target_ids):
+        """Link ``user`` to each of the targets.
+
+        Returns ``{target_id: created}`` for the targets that exist.
+        """
+        target_field = self._target_field()
+        target_model = target_field.related_model
+        user_id = getattr(user, 'pk', user)
+        connection = connections[self.db]
+        if connection.vendor != 'postgresql':
+            existing = set(target_model.objects.filter(
+                pk__in=target_ids
+            ).values_list('pk', flat=True))
+            linked = set(self.filter(
+                user_id=user_id,
+                **{f'{target_field.attname}__in': existing}
+            ).values_list(target_field.attname, flat=True))
+            self.bulk_create(
+                (
+                    self.model(user_id=user_id, **{target_field.attname: pk})
+                    for pk in existing - linked
+                ),
+                ignore_conflicts=True
+            )
+            return {pk: pk not in linked for pk in existing}
+
+        quote = connection.ops.quote_name
+        column = quote(target_field.column)
+        pk_column = quote(target_model._meta.pk.column)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'WITH target AS ('
+                f'SELECT {pk_column} AS id '
+                f'FROM {quote(target_model._meta.db_table)} '
+                f'WHERE {pk_column} = ANY(%s)), '
+                f'inserted AS ('
+                f'INSERT INTO {quote(self.model._meta.db_table)} '
+                f'({quote(self.model._meta.get_field("user").column)}, '
+                f'{column}) '
+                f'SELECT %s, id FROM target '
+                f'ON CONFLICT DO NOTHING RETURNING {column} AS id) '
+                f'SELECT target.id, inserted.id IS NOT NULL '
+                f'FROM target LEFT JOIN inserted ON inserted.id = target.id',
+                (list(target_ids), user_id)
+            )
+            return dict(cursor.fetchall())
+
+    def unlink_many(self, user, target_ids):
+        """Remove the links; returns the ids of the targets that were
+        linked."""
+        target_field = self._target_field()
+        links = self.filter(
+            user_id=getattr(user, 'pk', user),
+            **{f'{target_field.attname}__in': target_ids}
+        )
+        connection = connections[self.db]
+        if not connection.features.can_return_columns_from_insert:
+            unlinked = set(links.values_list(target_field.attname, flat=True))
+            links.delete()
+            return unlinked
+        target_ids = list(target_ids)
+        if not target_ids:
+            return set()
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {quote(self.model._meta.db_table)} '
+                f'WHERE {quote(self.model._meta.get_field("user").column)} '
+                f'= %s AND {quote(target_field.column)} IN '
+                f'({", ".join(["%s"] * len(target_ids))}) '
+                f'RETURNING {quote(target_field.column)}',
+                (getattr(user, 'pk', user), *target_ids)
+            )
+            return {row[0] for row in cursor.fetchall()}
+
+    def unlink(self, user, target_id):
+        """Remove the link; returns whether there was one."""
+        target_field = self._target_field()
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {quote(self.model._meta.db_table)} '
+                f'WHERE {quote(self.model._meta.get_field("user").column)} '
+                f'= %s AND {quote(target_field.column)} = %s',
+                (getattr(user, 'pk', user), target_id)
+            )
+            return cursor.rowcount > 0
+
+
 class FavoriteRecipe(models.Model):
     """Model for connection between recipes and users to create a list of favorites."""
 
@@ -169,6 +459,8 @@ class FavoriteRecipe(models.Model):
         related_name='favorite_recipe'
     )
 
+    objects = UserLinkManager()
+
     class Meta:
         verbose_name = 'Favorite recipe'
         verbose_name_plural = 'Favorite recipes'
@@ -197,6 +489,8 @@ class ShopRecipe(models.Model):
         related_name='shopping'
     )
 
+    objects = UserLinkManager()
+
     class Meta:
         verbose_name = 'Shopping list'
         verbose_name_plural = 'Shopping lists'
@@ -211,6 +505,266 @@ class ShopRecipe(models.Model):
         return f'{self.recipe} added to shopping cart for {self.user}'
 
 
+class ShopIngredientManager(models.Manager):
+    """Incremental maintenance of the materialized shopping lists."""
+
+    def contribution(self, recipe):
+        """Return ``{ingredient_id: (amount, 1)}`` for a recipe or its pk."""
+        result = {}
+        for ingredient_id, amount in RecipeIngredient.objects.filter(
+            recipe=recipe
+        ).values_list(
+            'ingredient_id',
+            'amount'
+        ):
+            result[ingredient_id] = (amount, 1)
+        return result
+
+    def add_recipe(self, user, recipe, sign=1):
+        """Add a recipe to the totals of one user or, with ``sign=-1``,
+        remove it."""
+        changes = {
+            (user.id, ingredient_id): (sign * amount, sign * count)
+            for ingredient_id, (amount, count)
+            in self.contribution(recipe).items()
+        }
+        self._apply(changes)
+
+    def add_recipes(self, user, recipe_ids, sign=1):
+        """Add several recipes to the totals of one user at once or, with
+        ``sign=-1``, remove them."""
+        changes = {}
+        for ingredient_id, amount in RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list(
+            'ingredient_id',
+            'amount'
+        ):
+            key = (user.id, ingredient_id)
+            total, count = changes.get(key, (0, 0))
+            changes[key] = (total + sign * amount, count + sign)
+        self._apply(changes)
+
+    def contributions(self, recipes):
+        """Return ``{recipe_id: contribution}`` for several recipe pks."""
+        result = {pk: {} for pk in recipes}
+        rows = RecipeIngredient.objects.filter(
+            recipe_id__in=result
+        ).values_list(
+            'recipe_id',
+            'ingredient_id',
+            'amount'
+        )
+        for recipe_id, ingredient_id, amount in rows:
+            result[recipe_id][ingredient_id] = (amount, 1)
+        return result
+
+    def replace_recipe(self, recipe, previous, current=None):
+        """Move every cart holding ``recipe`` from its ``previous``
+        contribution to ``current`` (an empty one drops the recipe)."""
+        pk = getattr(recipe, 'pk', recipe)
+        self.replace_recipes(
+            {pk: previous},
+            None if current is None else {pk: current}
+        )
+
+    def replace_recipes(self, previous, current=None):
+        """``replace_recipe`` for ``{recipe_id: contribution}``, with the
+        current contributions read at once when not given."""
+        if current is None:
+            current = self.contributions(previous)
+        differences = {}
+        for pk, contribution in previous.items():
+            new = current.get(pk, {})
+            difference = {}
+            for ingredient_id in contribution.keys() | new.keys():
+                old_amount, old_count = contribution.get(ingredient_id, (0, 0))
+                new_amount, new_count = new.get(ingredient_id, (0, 0))
+                if (old_amount, old_count) != (new_amount, new_count):
+                    difference[ingredient_id] = (
+                        new_amount - old_amount,
+                        new_count - old_count
+                    )
+            if difference:
+                differences[pk] = difference
+        if not differences:
+            return
+        changes = {}
+        for user_id, recipe_id in ShopRecipe.objects.filter(
+            recipe_id__in=differences
+        ).values_list('user_id', 'recipe_id'):
+            for ingredient_id, (amount, count) in differences[
+                recipe_id
+            ].items():
+                key = (user_id, ingredient_id)
+                total, number = changes.get(key, (0, 0))
+                changes[key] = (total + amount, number + count)
+        self._apply(changes)
+
+    def remove_recipes(self, recipes):
+        """Take recipes (a queryset or a list of pks) out of every cart
+        holding them, before they are deleted."""
+        self._apply({
+            (row['user_id'], row['ingredient_id']): (
+                -row['total'],
+                -row['count']
+            )
+            for row in self.calculate(recipes=recipes)
+        })
+
+    @contextmanager
+    def tracking(self, recipes):
+        """Keep the carts holding ``recipes`` (pks) in step with whatever
+        the block changes in their ingredients."""
+        previous = self.contributions(set(recipes))
+        yield
+        self.replace_recipes(previous)
+
+    def _apply(self, changes):
+        """Add ``{(user_id, ingredient_id): (amount, count)}`` to the
+        totals, dropping the rows no recipe contributes to any more."""
+        if not changes:
+            return
+        with transaction.atomic(using=self.db):
+            rows = {
+                (row.user_id, row.ingredient_id): row
+                for row in self.select_for_update().filter(
+                    user_id__in={user_id for user_id, _ in changes},
+                    ingredient_id__in={
+                        ingredient_id for _, ingredient_id in changes
+                    }
+                )
+            }
+            created, updated, deleted = [], [], []
+            for (user_id, ingredient_id), (amount, count) in changes.items():
+                row = rows.get((user_id, ingredient_id))
+                if row is None:
+                    if count > 0:
+                        created.append(self.model(
+                            user_id=user_id,
+                            ingredient_id=ingredient_id,
+                            amount=amount,
+                            recipes_count=count
+                        ))
+                    continue
+                row.amount += amount
+                row.recipes_count += count
+                if row.recipes_count > 0:
+                    updated.append(row)
+                else:
+                    deleted.append(row.pk)
+            self._insert_or_add(created)
+            self.bulk_update(updated, ('amount', 'recipes_count'))
+            self.filter(pk__in=deleted).delete()
+
+    def _insert_or_add(self, rows, batch_size=500):
+        """Insert new totals, or add them to the rows another transaction
+        inserted in the meantime.
+
+        select_for_update() cannot lock rows that do not exist yet, so two
+        carts gaining the same new ingredient at once would otherwise both
+        insert it and the second would fail on the unique constraint.
+        """
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        table = quote(self.model._meta.db_table)
+        amount, count = quote('amount'), quote('recipes_count')
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                cursor.execute(
+                    f'INSERT INTO {table} '
+                    f'({quote("user_id")}, {quote("ingredient_id")}, '
+                    f'{amount}, {count}) '
+                    f'VALUES {", ".join(["(%s, %s, %s, %s)"] * len(batch))} '
+                    f'ON CONFLICT ({quote("user_id")}, '
+                    f'{quote("ingredient_id")}) DO UPDATE SET '
+                    f'{amount} = {table}.{amount} + EXCLUDED.{amount}, '
+                    f'{count} = {table}.{count} + EXCLUDED.{count}',
+                    [
+                        value for row in batch for value in (
+                            row.user_id,
+                            row.ingredient_id,
+                            row.amount,
+                            row.recipes_count
+                        )
+                    ]
+                )
+
+    def calculate(self, user_ids=None, recipes=None):
+        """Aggregate the shopping lists from scratch, or only what the
+        given recipes bring to them."""
+        carts = ShopRecipe.objects.all()
+        if user_ids is not None:
+            carts = carts.filter(user_id__in=user_ids)
+        if recipes is not None:
+            carts = carts.filter(recipe__in=recipes)
+        return carts.values(
+            'user_id',
+            ingredient_id=F('recipe__recipe_ingredients__ingredient_id')
+        ).filter(
+            ingredient_id__isnull=False
+        ).annotate(
+            total=Sum('recipe__recipe_ingredients__amount'),
+            count=Count('recipe_id')
+        ).order_by()
+
+    def rebuild(self, user_ids=None):
+        """Replace the stored totals with freshly aggregated ones."""
+        with transaction.atomic():
+            stored = self.all()
+            if user_ids is not None:
+                stored = stored.filter(user_id__in=user_ids)
+            stored.delete()
+            self.bulk_create(
+                [
+                    self.model(
+                        user_id=row['user_id'],
+                        ingredient_id=row['ingredient_id'],
+                        amount=row['total'],
+                        recipes_count=row['count']
+                    )
+                    for row in self.calculate(user_ids).iterator()
+                ],
+                batch_size=1000
+            )
+
+
+class ShopIngredient(models.Model):
+    """Materialized shopping list: ingredient totals per user."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shop_ingredients'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shop_ingredients'
+    )
+    amount = models.IntegerField(default=0, verbose_name='Amount')
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Recipes'
+    )
+
+    objects = ShopIngredientManager()
+
+    class Meta:
+        verbose_name = 'Shopping list total'
+        verbose_name_plural = 'Shopping list totals'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shop_ingredient'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient}, {self.amount} for {self.user}'
+
+
 class Following(models.Model):
     """Follower and following model."""
 
@@ -227,6 +781,8 @@ class Following(models.Model):
         verbose_name='Author',
     )
 
+    objects = UserLinkManager()
+
     class Meta:
         verbose_name = 'Subscription'
         verbose_name_plural = 'Subscriptions'
@@ -239,3 +795,221 @@ class Following(models.Model):
 
     def __str__(self):
         return f'{self.user} subscribed to {self.author}'
+
+
+class FollowStatsManager(models.Manager):
+    """Keeps the follow counters in step with Following."""
+
+    def follow(self, user, author, delta=1):
+        """Add ``delta`` to the following count of ``user`` and to the
+        followers count of ``author`` with a single UPDATE."""
+        user_id = getattr(user, 'pk', user)
+        author_id = getattr(author, 'pk', author)
+        self.bulk_create(
+            [FollowStats(user_id=user_id), FollowStats(user_id=author_id)],
+            ignore_conflicts=True
+        )
+        self.filter(user_id__in=(user_id, author_id)).update(
+            following_count=Case(
+                When(user_id=user_id, then=F('following_count') + delta),
+                default=F('following_count')
+            ),
+            followers_count=Case(
+                When(user_id=author_id, then=F('followers_count') + delta),
+                default=F('followers_count')
+            )
+        )
+
+    def forget(self, user):
+        """Take a user who is about to be deleted out of the counters of
+        the authors they follow and of their followers."""
+        self.filter(
+            user__in=Following.objects.filter(user=user).values('author')
+        ).update(followers_count=F('followers_count') - 1)
+        self.filter(
+            user__in=Following.objects.filter(author=user).values('user')
+        ).update(following_count=F('following_count') - 1)
+
+    def reconcile(self):
+        """Fix the counters that drifted from Following.
+
+        Returns the number of users corrected.
+        """
+        self.bulk_create(
+            [
+                FollowStats(user_id=user_id)
+                for user_id in Following.objects.values_list(
+                    'user_id',
+                    flat=True
+                ).union(Following.objects.values_list('author_id'))
+            ],
+            ignore_conflicts=True
+        )
+        followers, following = (
+            Coalesce(
+                Subquery(
+                    Following.objects.filter(
+                        **{field: OuterRef('user')}
+                    ).order_by().values(field).annotate(
+                        total=Count('id')
+                    ).values('total')
+                ),
+                0
+            )
+            for field in ('author', 'user')
+        )
+        stale = self.annotate(
+            actual_followers=followers,
+            actual_following=following
+        ).exclude(
+            followers_count=F('actual_followers'),
+            following_count=F('actual_following')
+        )
+        return self.model.objects.filter(
+            pk__in=stale.values('pk')
+        ).update(followers_count=followers, following_count=following)
+
+
+class FollowStats(models.Model):
+    """Denormalized follow counters of a user."""
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='follow_stats',
+        verbose_name='User'
+    )
+    followers_count = models.IntegerField(
+        default=0,
+        verbose_name='Followers'
+    )
+    following_count = models.IntegerField(
+        default=0,
+        verbose_name='Following'
+    )
+
+    objects = FollowStatsManager()
+
+    class Meta:
+        verbose_name = 'Follow counters'
+        verbose_name_plural = 'Follow counters'
+
+    def __str__(self):
+        return f'{self.user} follow counters'
+
+
+class FeedEntryManager(models.Manager):
+    """Fan-out-on-write inbox upkeep.
+
+    Every method does nothing unless RECIPE_FEED_MODE is ``write``.
+    """
+
+    def enabled(self):
+        return settings.RECIPE_FEED_MODE == 'write'
+
+    def fan_out(self, recipe):
+        """Deliver a new recipe to the inbox of every follower."""
+        if not self.enabled():
+            return
+        followers = Following.objects.filter(
+            author_id=recipe.author_id
+        ).values_list('user_id', flat=True)
+        batch_size = settings.RECIPE_FEED_BATCH_SIZE
+        batch = []
+        for user_id in followers.iterator(chunk_size=batch_size):
+            batch.append(FeedEntry(
+                user_id=user_id,
+                recipe_id=recipe.pk,
+                author_id=recipe.author_id,
+                pub_date=recipe.pub_date
+            ))
+            if len(batch) == batch_size:
+                self.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        self.bulk_create(batch, ignore_conflicts=True)
+
+    def follow(self, user, author):
+        """Backfill the latest recipes of a newly followed author."""
+        if not self.enabled():
+            return
+        recipes = Recipe.objects.filter(author=author).order_by(
+            '-pub_date', '-id'
+        ).values_list('id', 'pub_date')[:settings.RECIPE_FEED_BACKFILL]
+        self.bulk_create(
+            (
+                FeedEntry(
+                    user_id=getattr(user, 'pk', user),
+                    recipe_id=recipe_id,
+                    author_id=getattr(author, 'pk', author),
+                    pub_date=pub_date
+                )
+                for recipe_id, pub_date in recipes
+            ),
+            ignore_conflicts=True
+        )
+
+    def unfollow(self, user, author):
+        if not self.enabled():
+            return
+        self.filter(user=user, author=author).delete()
+
+    @transaction.atomic
+    def rebuild(self):
+        """Refill every inbox from Following."""
+        self.all().delete()
+        if not self.enabled():
+            return
+        for user_id, author_id in Following.objects.values_list(
+            'user_id', 'author_id'
+        ).iterator():
+            self.follow(user_id, author_id)
+
+
+class FeedEntry(models.Model):
+    """Recipe delivered to a follower's feed inbox."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Follower'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Recipe'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Author'
+    )
+    pub_date = models.DateTimeField(verbose_name='Date')
+
+    objects = FeedEntryManager()
+
+    class Meta:
+        verbose_name = 'Feed entry'
+        verbose_name_plural = 'Feed entries'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feedentry_user_pub_date'
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='feedentry_user_author'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} in the feed of {self.user}'
@@ -0,0 +1,49 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class AddPostgresIndex(migrations.AddIndex):
+    """AddIndex that is only applied to PostgreSQL databases.
+
+    Keeps PostgreSQL-specific indexes (GIN, operator classes) in the model
+    state while letting the migrations run on SQLite for local work.
+
+    SQLite rebuilds a table to alter it and recreates every index of the
+    model state, these ones included, as plain indexes. Unapplying drops
+    such a copy if there is one, so that the columns it covers can be
+    removed afterwards.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(
+                app_label, schema_editor, from_state, to_state
+            )
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        else:
+            schema_editor.execute(
+                f'DROP INDEX IF EXISTS '
+                f'{schema_editor.quote_name(self.index.name)}'
+            )
+
+
+class PostgresTrigramExtension(TrigramExtension):
+    """TrigramExtension that is skipped on other databases both ways.
+
+    The stock operation only checks the vendor when applied, so
+    unapplying it on SQLite queries pg_extension and fails.
+    """
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(
+                app_label, schema_editor, from_state, to_state
+            )